@@ -74,13 +74,64 @@ def tinyMazeSearch(problem):
     return [s, s, w, s, w, w, s, w]
 
 
+class SearchNode:
+    """
+    A state reached by a search, with the action, total path cost and parent
+    node it was reached by.  The path itself is only built when a goal is
+    found.
+    """
+    __slots__ = ('state', 'action', 'cost', 'parent')
+
+    def __init__(self, state, action=None, cost=0, parent=None):
+        self.state = state
+        self.action = action
+        self.cost = cost
+        self.parent = parent
+
+    def getPath(self):
+        "Returns the actions that lead from the start state to this node"
+        path = []
+        node = self
+        while node.parent is not None:
+            path.append(node.action)
+            node = node.parent
+        path.reverse()
+        return path
+
+
 def getPathFromNode(node):
-    path = []
-    while node['PrevNode'] is not None:
-        path.append(node['Action'])
-        node = node['PrevNode']
-    path.reverse()
-    return path
+    return node.getPath()
+
+
+def graphSearch(problem, fringe, priority=None):
+    """
+    The graph search shared by the algorithms below, which differ only in
+    their fringe.  Nodes are goal-tested when popped, and a state is only
+    expanded the first time it is popped.  priority(node), if given, is
+    the priority nodes are pushed onto a PriorityQueue fringe with.
+
+    Expanded states are kept in a set, keyed by problem.getStateKey(state)
+    when the problem has one (for states that are not hashable), and by the
+    state itself otherwise.
+    """
+    stateKey = getattr(problem, 'getStateKey', None)
+    if priority is None:
+        push = fringe.push
+    else:
+        push = lambda node: fringe.push(node, priority(node))
+    closed = set()
+    push(SearchNode(problem.getStartState()))
+    while not fringe.isEmpty():
+        node = fringe.pop()
+        state = node.state
+        if problem.isGoalState(state):
+            return node.getPath()
+        key = state if stateKey is None else stateKey(state)
+        if key not in closed:
+            closed.add(key)
+            for successor, action, stepCost in problem.getSuccessors(state):
+                push(SearchNode(successor, action, node.cost + stepCost, node))
+    return []
 
 
 def depthFirstSearch(problem):
@@ -98,80 +149,17 @@ def depthFirstSearch(problem):
     print("Start's successors:", problem.getSuccessors(problem.getStartState()))
     """
 
-    from util import Stack
-    closed_set = []
-    sk = Stack()
-    start_state = problem.getStartState()
-    start_node = {'State': start_state,
-                  'Action': None,
-                  'Cost': 0,
-                  'PrevNode': None}
-    sk.push(start_node)
-    while not sk.isEmpty():
-        node = sk.pop()
-        if problem.isGoalState(node['State']):
-            return getPathFromNode(node)
-        if node['State'] not in closed_set:
-            closed_set.append(node['State'])
-            for successor in problem.getSuccessors(node['State']):
-                new_node = {'State': successor[0],
-                            'Action': successor[1],
-                            'Cost': successor[2],
-                            'PrevNode': node}
-                sk.push(new_node)
-    return []
+    return graphSearch(problem, util.Stack())
 
 
 def breadthFirstSearch(problem):
     """Search the shallowest nodes in the search tree first."""
-    from util import Queue
-    closed_set = []
-    queue = Queue()
-    start_state = problem.getStartState()
-    start_node = {'State': start_state,
-                  'Action': None,
-                  'Cost': 0,
-                  'PrevNode': None}
-    queue.push(start_node)
-    while not queue.isEmpty():
-        node = queue.pop()
-        if problem.isGoalState(node['State']):
-            return getPathFromNode(node)
-        if node['State'] not in closed_set:
-            closed_set.append(node['State'])
-            for successor in problem.getSuccessors(node['State']):
-                new_node = {'State': successor[0],
-                            'Action': successor[1],
-                            'Cost': successor[2],
-                            'PrevNode': node}
-                queue.push(new_node)
-    return []
+    return graphSearch(problem, util.Queue())
 
 
 def uniformCostSearch(problem):
     """Search the node of least total cost first."""
-    from util import PriorityQueue
-    closed_set = []
-    queue = PriorityQueue()
-    start_state = problem.getStartState()
-    start_node = {'State': start_state,
-                  'Action': None,
-                  'Cost': 0,
-                  'PrevNode': None}
-    queue.push(start_node, 0)
-    while not queue.isEmpty():
-        node = queue.pop()
-        if problem.isGoalState(node['State']):
-            return getPathFromNode(node)
-        if node['State'] not in closed_set:
-            closed_set.append(node['State'])
-            for successor in problem.getSuccessors(node['State']):
-                new_node = {'State': successor[0],
-                            'Action': successor[1],
-                            'Cost': successor[2] + node['Cost'],
-                            'PrevNode': node}
-                queue.push(new_node, new_node['Cost'])
-    return []
+    return graphSearch(problem, util.PriorityQueue(), lambda node: node.cost)
 
 
 def nullHeuristic(state, problem=None):
@@ -184,34 +172,160 @@ def nullHeuristic(state, problem=None):
 
 def aStarSearch(problem, heuristic=nullHeuristic):
     """Search the node that has the lowest combined cost and heuristic first."""
-    from util import PriorityQueue
-    closed_set = []
-    queue = PriorityQueue()
-    start_state = problem.getStartState()
-    start_heuristic = heuristic(start_state, problem)
-    start_node = {'State': start_state,
-                  'Action': None,
-                  'Cost': 0,
-                  'PrevNode': None}
-    queue.push(start_node, 0 + start_heuristic)
-    while not queue.isEmpty():
-        node = queue.pop()
-        if problem.isGoalState(node['State']):
-            return getPathFromNode(node)
-        if node['State'] not in closed_set:
-            closed_set.append(node['State'])
-            for successor in problem.getSuccessors(node['State']):
-                new_node = {'State': successor[0],
-                            'Action': successor[1],
-                            'Cost': successor[2] + node['Cost'],
-                            'PrevNode': node}
-                new_heuristic = heuristic(successor[0], problem)
-                queue.push(new_node, new_node['Cost'] + new_heuristic)
+    return graphSearch(problem, util.PriorityQueue(),
+                       lambda node: node.cost + heuristic(node.state, problem))
+
+
+def iterativeDeepeningAStarSearch(problem, heuristic=nullHeuristic):
+    """
+    Runs depth-first searches that give up on any node whose cost plus
+    heuristic exceeds a bound, raising the bound each time to the smallest
+    value that went over it, until a goal is found.  Only the current path
+    is kept (a state is not repeated along it), so memory grows with the
+    depth of the solution rather than the number of states reached, at the
+    price of expanding states again.  With an admissible heuristic the path
+    is optimal.
+    """
+    stateKey = getattr(problem, 'getStateKey', None)
+    start = problem.getStartState()
+    if problem.isGoalState(start):
+        return []
+    startKey = start if stateKey is None else stateKey(start)
+    bound = heuristic(start, problem)
+    while bound < float('inf'):
+        nextBound = float('inf')
+        actions, costs, keys = [], [0], [startKey]
+        onPath = set(keys)
+        successors = [iter(problem.getSuccessors(start))]
+        while len(successors) > 0:
+            for successor, action, stepCost in successors[-1]:
+                key = successor if stateKey is None else stateKey(successor)
+                if key in onPath:
+                    continue
+                cost = costs[-1] + stepCost
+                estimate = cost + heuristic(successor, problem)
+                if estimate > bound:
+                    nextBound = min(nextBound, estimate)
+                    continue
+                actions.append(action)
+                if problem.isGoalState(successor):
+                    return actions
+                costs.append(cost)
+                keys.append(key)
+                onPath.add(key)
+                successors.append(iter(problem.getSuccessors(successor)))
+                break
+            else:
+                successors.pop()
+                if len(actions) > 0:
+                    actions.pop()
+                    costs.pop()
+                    onPath.discard(keys.pop())
+        bound = nextBound
     return []
 
 
+class ReversedSearchProblem(SearchProblem):
+    """
+    The search problem of getting from problem's goal back to its start,
+    for a problem with a single goal state (problem.goal) that can list the
+    predecessors of a state (problem.getPredecessors).  Successors in the
+    reversed problem are the predecessors in the original one, each with
+    the action that leads from the predecessor to the state.
+    """
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.goal = problem.getStartState()
+
+    def getStartState(self):
+        return self.problem.goal
+
+    def isGoalState(self, state):
+        return state == self.goal
+
+    def getSuccessors(self, state):
+        return self.problem.getPredecessors(state)
+
+
+def bidirectionalSearch(problem, heuristic=nullHeuristic):
+    """
+    Searches forward from the start and backward from the goal at the same
+    time, expanding the smaller of the two fringes, until the cheapest path
+    through a state reached from both sides is known to be the cheapest path
+    overall.  The problem needs a single goal state (problem.goal) and a
+    getPredecessors method (see ReversedSearchProblem).
+
+    With the null heuristic this is a bidirectional uniform cost search
+    (bidirectional breadth-first search when every step costs 1), which
+    expands about two balls of half the solution depth instead of one ball
+    of the whole depth.  With a consistent heuristic it is bidirectional A*:
+    heuristic(state, problem) estimates the distance to the goal and
+    heuristic(state, ReversedSearchProblem(problem)) the distance back to the
+    start, and each side is ordered by the cost so far plus half the
+    difference of the two estimates.  Both sides then search the same
+    reweighted graph, so the usual stopping rule of bidirectional uniform
+    cost search still holds.
+    """
+    problems = (problem, ReversedSearchProblem(problem))
+    start = problem.getStartState()
+    if problem.isGoalState(start):
+        return []
+
+    def potential(state):
+        return (heuristic(state, problems[0]) - heuristic(state, problems[1])) / 2.0
+
+    signs = (1, -1)
+    fringes = (util.IndexedPriorityQueue(), util.IndexedPriorityQueue())
+    reached = ({}, {})
+    closed = (set(), set())
+    tops = [0, 0]
+    for side in (0, 1):
+        state = problems[side].getStartState()
+        reached[side][state] = SearchNode(state)
+        tops[side] = signs[side] * potential(state)
+        fringes[side].push(state, tops[side])
+
+    best = float('inf')
+    meeting = None
+    while not fringes[0].isEmpty() and not fringes[1].isEmpty():
+        side = 0 if len(fringes[0]) <= len(fringes[1]) else 1
+        other = 1 - side
+        state = fringes[side].pop()
+        node = reached[side][state]
+        tops[side] = node.cost + signs[side] * potential(state)
+        if tops[0] + tops[1] >= best:
+            break
+        closed[side].add(state)
+        for successor, action, stepCost in problems[side].getSuccessors(state):
+            if successor in closed[side]:
+                continue
+            cost = node.cost + stepCost
+            previous = reached[side].get(successor)
+            if previous is not None and previous.cost <= cost:
+                continue
+            newNode = SearchNode(successor, action, cost, node)
+            reached[side][successor] = newNode
+            fringes[side].push(successor, cost + signs[side] * potential(successor))
+            otherNode = reached[other].get(successor)
+            if otherNode is not None and cost + otherNode.cost < best:
+                best = cost + otherNode.cost
+                meeting = (newNode, otherNode) if side == 0 else (otherNode, newNode)
+
+    if meeting is None:
+        return []
+    forwardNode, backwardNode = meeting
+    path = forwardNode.getPath()
+    while backwardNode.parent is not None:
+        path.append(backwardNode.action)
+        backwardNode = backwardNode.parent
+    return path
+
+
 # Abbreviations
 bfs = breadthFirstSearch
 dfs = depthFirstSearch
 astar = aStarSearch
 ucs = uniformCostSearch
+bds = bidirectionalSearch
+idastar = iterativeDeepeningAStarSearch
@@ -124,6 +124,17 @@ class PositionSearchProblem(search.SearchProblem):
 
         return successors
 
+    def getPredecessors(self, state):
+        """
+        Returns (predecessor, action, stepCost) triples for the states one move
+        away from state, with the action that leads from the predecessor to
+        state and its cost, for searching backward from the goal (see
+        search.bidirectionalSearch).
+        """
+        cost = self.costFn(state)
+        return [ (nextState, Actions.reverseDirection(action), cost)
+                 for nextState, action, stepCost in self.getSuccessors(state) ]
+
     def getCostOfActions(self, actions):
         """
         Returns the cost of a particular sequence of actions. If those actions
@@ -160,6 +171,10 @@ def mazeDistance(point1, point2, gameState):
 
     Example usage: mazeDistance( (2,4), (5,6), gameState)
 
+    The search runs from both points at once (search.bidirectionalSearch),
+    which expands far fewer cells than a breadth-first search from point1 on
+    open layouts.
+
     This might be a useful helper function for your ApproximateSearchAgent.
     """
     x1, y1 = point1
@@ -168,4 +183,4 @@ def mazeDistance(point1, point2, gameState):
     assert not walls[x1][y1], 'point1 is a wall: ' + str(point1)
     assert not walls[x2][y2], 'point2 is a wall: ' + str(point2)
     prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
-    return len(search.bfs(prob))
+    return len(search.bidirectionalSearch(prob))
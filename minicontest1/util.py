@@ -222,6 +222,112 @@ class PriorityQueueWithFunction(PriorityQueue):
         PriorityQueue.push(self, item, self.priorityFunction(item))
 
 
+class IndexedPriorityQueue:
+    """
+    A priority queue that also knows where each item is in its heap, so
+    that changing the priority of an item, removing it, or asking whether it
+    is queued takes O(log n) time rather than a scan of the whole heap.
+
+    Items must be hashable, and each item is queued at most once: pushing an
+    item that is already queued just changes its priority.  Items of equal
+    priority are popped in the order they were first pushed.
+    """
+    def  __init__(self):
+        self.heap = []
+        self.positions = {}
+        self.count = 0
+
+    def push(self, item, priority):
+        if item in self.positions:
+            self._replace(self.positions[item], priority)
+            return
+        entry = (priority, self.count, item)
+        self.count += 1
+        self.heap.append(entry)
+        self._siftUp(len(self.heap) - 1)
+
+    def pop(self):
+        return self._removeAt(0)[2]
+
+    def isEmpty(self):
+        return len(self.heap) == 0
+
+    def update(self, item, priority):
+        """
+        Lowers the priority of item if it is queued with a higher one, and
+        pushes it if it is not queued at all.
+        """
+        if item not in self.positions:
+            self.push(item, priority)
+            return
+        position = self.positions[item]
+        if priority < self.heap[position][0]:
+            self._replace(position, priority)
+
+    def remove(self, item):
+        "Removes item from the queue.  Raises KeyError if it is not queued."
+        self._removeAt(self.positions[item])
+
+    def getPriority(self, item):
+        return self.heap[self.positions[item]][0]
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _replace(self, position, priority):
+        _, count, item = self.heap[position]
+        self.heap[position] = (priority, count, item)
+        if self._siftUp(position) == position:
+            self._siftDown(position)
+
+    def _removeAt(self, position):
+        heap = self.heap
+        entry = heap[position]
+        del self.positions[entry[2]]
+        last = heap.pop()
+        if position < len(heap):
+            heap[position] = last
+            if self._siftUp(position) == position:
+                self._siftDown(position)
+        return entry
+
+    def _siftUp(self, position):
+        "Moves the entry at position up to its place, and returns where that is"
+        heap, positions = self.heap, self.positions
+        entry = heap[position]
+        while position > 0:
+            parentPosition = (position - 1) >> 1
+            parent = heap[parentPosition]
+            if not entry < parent:
+                break
+            heap[position] = parent
+            positions[parent[2]] = position
+            position = parentPosition
+        heap[position] = entry
+        positions[entry[2]] = position
+        return position
+
+    def _siftDown(self, position):
+        heap, positions = self.heap, self.positions
+        size = len(heap)
+        entry = heap[position]
+        child = 2 * position + 1
+        while child < size:
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if not heap[child] < entry:
+                break
+            heap[position] = heap[child]
+            positions[heap[position][2]] = position
+            position = child
+            child = 2 * position + 1
+        heap[position] = entry
+        positions[entry[2]] = position
+
+
 def manhattanDistance( xy1, xy2 ):
     "Returns the Manhattan distance between points xy1 and xy2"
     return abs( xy1[0] - xy2[0] ) + abs( xy1[1] - xy2[1] )
@@ -599,47 +705,224 @@ def pause():
 
 # code to handle timeouts
 #
-# FIXME
-# NOTE: TimeoutFuncton is NOT reentrant.  Later timeouts will silently
-# disable earlier timeouts.  Could be solved by maintaining a global list
-# of active time outs.  Currently, questions which have test cases calling
-# this have all student code so wrapped.
+# A TimeoutFunction gives the function it wraps a deadline, in seconds (which
+# may be fractional).  Deadlines nest: each thread keeps a stack of them, and
+# remainingTime() reports how long the innermost one has left, so anytime
+# agents can poll it and return before they are cut off.
+#
+# On the main thread the deadline is enforced with a SIGALRM interval timer;
+# an enclosing timer is shortened rather than silently disabled.  Any other
+# thread gets a watchdog timer that raises the exception in it.  Neither can
+# interrupt a long call into C code, so inProcess=True runs the function in a
+# forked child that is killed at the deadline.  The child works on copies:
+# changes it makes to the agent or its arguments are lost.
+#
+# Every TimeoutFunctionException names the TimeoutFunction whose deadline
+# passed.  Code that catches the exception around its own TimeoutFunction
+# should re-raise it unless timedFunction.ownsTimeout(exception), so that an
+# enclosing deadline is not lost; and a call that returns after swallowing
+# the exception for its own or an enclosing deadline raises it again.
 #
 import signal
 import time
+import threading
+
+
 class TimeoutFunctionException(Exception):
-    """Exception to raise on a timeout"""
-    pass
+    """
+    Exception to raise on a timeout.  timeoutFunction is the TimeoutFunction
+    whose deadline passed, and deadline that deadline (in time.monotonic()
+    seconds), when they are known.
+    """
+
+    def __init__(self, timeoutFunction=None, deadline=None):
+        Exception.__init__(self)
+        self.timeoutFunction = timeoutFunction
+        self.deadline = deadline
+
+
+class _Deadline:
+    __slots__ = ('time', 'timeoutFunction', 'fired')
+
+    def __init__(self, time, timeoutFunction):
+        self.time = time
+        self.timeoutFunction = timeoutFunction
+        self.fired = False
+
+
+_DEADLINES = threading.local()
+
+
+def _deadlineStack():
+    if not hasattr(_DEADLINES, 'stack'):
+        _DEADLINES.stack = []
+    return _DEADLINES.stack
+
+
+def _timeout(deadline):
+    "Marks deadline as fired and returns the exception for it"
+    deadline.fired = True
+    return TimeoutFunctionException(deadline.timeoutFunction, deadline.time)
+
+
+def remainingTime():
+    """
+    Returns the seconds left before the innermost TimeoutFunction running on
+    this thread times out, or infinity when no deadline applies.
+    """
+    stack = _deadlineStack()
+    if len(stack) == 0:
+        return float('inf')
+    return max(0.0, min([deadline.time for deadline in stack]) - time.monotonic())
 
 
 class TimeoutFunction:
-    def __init__(self, function, timeout):
+    def __init__(self, function, timeout, inProcess=False):
         self.timeout = timeout
         self.function = function
+        self.inProcess = inProcess
 
     def handle_timeout(self, signum, frame):
-        raise TimeoutFunctionException()
+        """
+        Raises the exception for the earliest deadline on this thread that
+        has passed, which is not always this function's own.
+        """
+        stack = _deadlineStack()
+        now = time.monotonic()
+        expired = [deadline for deadline in stack if deadline.time <= now]
+        if len(expired) == 0:
+            # The timer went off a hair early: it was set for the earliest
+            expired = stack
+        if len(expired) == 0:
+            raise TimeoutFunctionException(self)
+        raise _timeout(min(expired, key=lambda deadline: deadline.time))
+
+    def ownsTimeout(self, exception):
+        """
+        Whether a TimeoutFunctionException is for this function's deadline
+        (or for no deadline in particular).
+        """
+        return exception.timeoutFunction is None or exception.timeoutFunction is self
 
     def __call__(self, *args, **keyArgs):
-        # If we have SIGALRM signal, use it to cause an exception if and
-        # when this function runs too long.  Otherwise check the time taken
-        # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
-            old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
-            try:
-                result = self.function(*args, **keyArgs)
-            finally:
-                signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
-        else:
-            startTime = time.time()
+        if self.timeout <= 0:
+            raise TimeoutFunctionException(self, time.monotonic())
+        stack = _deadlineStack()
+        deadline = _Deadline(time.monotonic() + self.timeout, self)
+        stack.append(deadline)
+        try:
+            if self.inProcess:
+                result = self._callInProcess(args, keyArgs)
+            elif hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread():
+                result = self._callWithAlarm(args, keyArgs)
+            else:
+                result = self._callWithWatchdog(args, keyArgs)
+        except TimeoutFunctionException as e:
+            if e.timeoutFunction is None:
+                # Raised by a watchdog, which cannot say whose deadline it was
+                try:
+                    self.handle_timeout(None, None)
+                except TimeoutFunctionException as attributed:
+                    e.timeoutFunction, e.deadline = attributed.timeoutFunction, attributed.deadline
+            raise
+        finally:
+            stack.pop()
+        # The function returned, but it may have swallowed the exception for
+        # this deadline or an enclosing one
+        if deadline.fired:
+            raise TimeoutFunctionException(self, deadline.time)
+        if len(stack) > 0 and remainingTime() <= 0:
+            raise _timeout(min(stack, key=lambda enclosing: enclosing.time))
+        return result
+
+    def _callWithAlarm(self, args, keyArgs):
+        startTime = time.monotonic()
+        old = signal.signal(signal.SIGALRM, self.handle_timeout)
+        outer = signal.setitimer(signal.ITIMER_REAL, self.timeout)[0]
+        if 0 < outer < self.timeout:
+            signal.setitimer(signal.ITIMER_REAL, outer)
+        try:
             result = self.function(*args, **keyArgs)
-            timeElapsed = time.time() - startTime
-            if timeElapsed >= self.timeout:
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old)
+            if outer > 0:
+                # Put back the enclosing timer, firing at once if it is due
+                left = outer - (time.monotonic() - startTime)
+                signal.setitimer(signal.ITIMER_REAL, max(left, 1e-6))
+        return result
+
+    def _callWithWatchdog(self, args, keyArgs):
+        try:
+            import ctypes
+            setAsyncExc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+        except (ImportError, AttributeError):
+            # No way to interrupt the thread: check the time taken afterwards
+            startTime = time.monotonic()
+            result = self.function(*args, **keyArgs)
+            if time.monotonic() - startTime >= self.timeout:
                 self.handle_timeout(None, None)
+            return result
+
+        threadId = ctypes.c_ulong(threading.get_ident())
+        lock = threading.Lock()
+        state = {'done': False, 'fired': False}
+
+        def expire():
+            with lock:
+                if not state['done']:
+                    state['fired'] = True
+                    setAsyncExc(threadId, ctypes.py_object(
+                        TimeoutFunctionException))
+        watchdog = threading.Timer(self.timeout, expire)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            result = self.function(*args, **keyArgs)
+        finally:
+            with lock:
+                state['done'] = True
+                watchdog.cancel()
+                if state['fired']:
+                    # Drop the exception if it has not been raised yet
+                    setAsyncExc(threadId, None)
+        if state['fired']:
+            self.handle_timeout(None, None)
         return result
 
+    def _callInProcess(self, args, keyArgs):
+        import multiprocessing
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(False)
+
+        def target():
+            try:
+                sender.send((True, self.function(*args, **keyArgs)))
+            except BaseException as e:
+                sender.send((False, e))
+        process = context.Process(target=target)
+        process.daemon = True
+        process.start()
+        sender.close()
+        try:
+            if not receiver.poll(self.timeout):
+                process.kill()
+                self.handle_timeout(None, None)
+            try:
+                succeeded, value = receiver.recv()
+            except (EOFError, OSError):
+                # The child died without sending anything back
+                process.join()
+                raise Exception('%s died in its child process with exit code %s' %
+                                (getattr(self.function, '__name__', self.function),
+                                 process.exitcode))
+        finally:
+            receiver.close()
+            process.join()
+        if not succeeded:
+            raise value
+        return value
+
 
 
 _ORIGINAL_STDOUT = None
@@ -58,8 +58,8 @@ from game import Grid
 from game import Configuration
 from game import Agent
 from game import reconstituteGrid
-import sys, util, types, time, random, imp
-import keyboardAgents
+import sys, util, types, time, random
+import importlib.util
 
 # If you change these, you won't affect the server, so you can't cheat
 KILL_POINTS = 0
@@ -817,6 +817,10 @@ def readCommand( argv ):
                     help=default('How many episodes are training (suppresses output)'), default=0)
   parser.add_option('-c', '--catchExceptions', action='store_true', default=False,
                     help='Catch exceptions and enforce time limits')
+  parser.add_option('--workers', type='int', default=1,
+                    help=default('Number of processes to play the games in parallel'))
+  parser.add_option('--seed', default=None,
+                    help='Master random seed; each game is seeded from it, so results do not depend on --workers')
 
   options, otherjunk = parser.parse_args(argv)
   assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
@@ -874,6 +878,7 @@ def readCommand( argv ):
   numKeyboardAgents = 0
   for index, val in enumerate([options.keys0, options.keys1, options.keys2, options.keys3]):
     if not val: continue
+    import keyboardAgents
     if numKeyboardAgents == 0:
       agent = keyboardAgents.KeyboardAgent(index)
     elif numKeyboardAgents == 1:
@@ -905,6 +910,11 @@ def readCommand( argv ):
   args['numTraining'] = options.numTraining
   args['record'] = options.record
   args['catchExceptions'] = options.catchExceptions
+  args['workers'] = options.workers
+  args['seed'] = options.seed
+  if options.workers > 1 and options.seed == None:
+    args['seed'] = 'cs188' if options.fixRandomSeed else str(random.randrange(2 ** 32))
+    print('Using master random seed %s' % args['seed'])
   return args
 
 def randomLayout(seed = None):
@@ -922,7 +932,11 @@ def loadAgents(isRed, factory, textgraphics, cmdLineArgs):
     if not factory.endswith(".py"):
       factory += ".py"
 
-    module = imp.load_source('player' + str(int(isRed)), factory)
+    name = 'player' + str(int(isRed))
+    spec = importlib.util.spec_from_file_location(name, factory)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
   except (NameError, ImportError):
     print('Error: The team "' + factory + '" could not be loaded! ', file=sys.stderr)
     traceback.print_exc()
@@ -968,7 +982,64 @@ def replayGame( layout, agents, actions, display, length, redTeamName, blueTeamN
 
     display.finish()
 
-def runGames( layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False ):
+def gameSeed(seed, gameIndex):
+  """
+  The random seed for the game at gameIndex, derived from the master seed.
+  """
+  return '%s-%d' % (seed, gameIndex)
+
+# Game components shared with forked worker processes by runGamesInParallel
+_PARALLEL_GAME = {}
+
+def _playGameInWorker(gameIndex):
+  import textDisplay
+  options = _PARALLEL_GAME
+  random.seed(gameSeed(options['seed'], gameIndex))
+  rules = CaptureRules(quiet=True)
+  g = rules.newGame( options['layouts'][gameIndex], options['agents'], textDisplay.NullGraphics(),
+                     options['length'], options['muteAgents'], options['catchExceptions'] )
+  g.run()
+  # Agents and displays need not be picklable; the caller only wants results
+  g.agents = None
+  g.display = None
+  return gameIndex, g
+
+def runGamesInParallel( layouts, agents, length, numGames, muteAgents, catchExceptions, workers, seed ):
+  """
+  Plays numGames games across a pool of worker processes, without graphics.
+  Each game is seeded with gameSeed(seed, i), so its outcome is the same as
+  in a sequential run with the same seed.  Games are reported as they finish
+  and returned in order.
+  """
+  import multiprocessing
+  if 'fork' not in multiprocessing.get_all_start_methods():
+    raise Exception('Parallel games need the fork process start method')
+  _PARALLEL_GAME.update({'layouts': layouts, 'agents': agents, 'length': length, 'seed': seed,
+                         'muteAgents': muteAgents, 'catchExceptions': catchExceptions})
+  games = [None] * numGames
+  pool = multiprocessing.get_context('fork').Pool(workers)
+  try:
+    for gameIndex, g in pool.imap_unordered(_playGameInWorker, range(numGames)):
+      print('Game %d finished with score %d' % (gameIndex + 1, g.state.data.score))
+      games[gameIndex] = g
+  finally:
+    pool.close()
+    pool.join()
+    _PARALLEL_GAME.clear()
+  return games
+
+def recordGame( layout, agents, g, gameIndex, length, redTeamName, blueTeamName ):
+  import time, pickle, game
+  #fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+  #f = file(fname, 'w')
+  components = {'layout': layout, 'agents': [game.Agent() for a in agents], 'actions': g.moveHistory, 'length': length, 'redTeamName': redTeamName, 'blueTeamName':blueTeamName }
+  #f.close()
+  print("recorded")
+  g.record = pickle.dumps(components)
+  with open('replay-%d'%gameIndex,'wb') as f:
+    f.write(g.record)
+
+def runGames( layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False, workers=1, seed=None ):
 
   rules = CaptureRules()
   games = []
@@ -976,32 +1047,35 @@ def runGames( layouts, agents, display, length, numGames, record, numTraining, r
   if numTraining > 0:
     print('Playing %d training games' % numTraining)
 
-  for i in range( numGames ):
-    beQuiet = i < numTraining
-    layout = layouts[i]
-    if beQuiet:
-        # Suppress output and graphics
-        import textDisplay
-        gameDisplay = textDisplay.NullGraphics()
-        rules.quiet = True
-    else:
-        gameDisplay = display
-        rules.quiet = False
-    g = rules.newGame( layout, agents, gameDisplay, length, muteAgents, catchExceptions )
-    g.run()
-    if not beQuiet: games.append(g)
-
-    g.record = None
-    if record:
-      import time, pickle, game
-      #fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-      #f = file(fname, 'w')
-      components = {'layout': layout, 'agents': [game.Agent() for a in agents], 'actions': g.moveHistory, 'length': length, 'redTeamName': redTeamName, 'blueTeamName':blueTeamName }
-      #f.close()
-      print("recorded")
-      g.record = pickle.dumps(components)
-      with open('replay-%d'%i,'wb') as f:
-        f.write(g.record)
+  if workers > 1:
+    if numTraining > 0:
+      raise Exception('Training games cannot be played in parallel workers')
+    games = runGamesInParallel( layouts, agents, length, numGames, muteAgents, catchExceptions, workers, seed )
+    for i, g in enumerate(games):
+      g.record = None
+      if record:
+        recordGame( layouts[i], agents, g, i, length, redTeamName, blueTeamName )
+  else:
+    for i in range( numGames ):
+      if seed != None:
+        random.seed(gameSeed(seed, i))
+      beQuiet = i < numTraining
+      layout = layouts[i]
+      if beQuiet:
+          # Suppress output and graphics
+          import textDisplay
+          gameDisplay = textDisplay.NullGraphics()
+          rules.quiet = True
+      else:
+          gameDisplay = display
+          rules.quiet = False
+      g = rules.newGame( layout, agents, gameDisplay, length, muteAgents, catchExceptions )
+      g.run()
+      if not beQuiet: games.append(g)
+
+      g.record = None
+      if record:
+        recordGame( layout, agents, g, i, length, redTeamName, blueTeamName )
 
   if numGames > 1:
     scores = [game.state.data.score for game in games]
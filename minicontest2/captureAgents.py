@@ -20,6 +20,7 @@ from game import Agent
 import distanceCalculator
 from util import nearestPoint
 import util
+import sys
 
 # Note: the following class is not used, but is kept for backwards
 # compatibility with team submissions that try to import it.
@@ -51,6 +52,10 @@ class CaptureAgent(Agent):
   Recommended Usage:  Subclass CaptureAgent and override chooseAction.
   """
 
+  # observationFunction hands the agent a copy of the state (see
+  # makeObservation), so Game need not copy it first
+  mutatesObservations = False
+
   #############################
   # Methods to store key info #
   #############################
@@ -124,7 +129,9 @@ class CaptureAgent(Agent):
 
   def debugDraw(self, cells, color, clear=False):
 
-    if self.display:
+    # The display can only be a PacmanGraphics once captureGraphicsDisplay
+    # is loaded, so quiet and text games never import it (and Tk) here
+    if self.display and 'captureGraphicsDisplay' in sys.modules:
       from captureGraphicsDisplay import PacmanGraphics
       if isinstance(self.display, PacmanGraphics):
         if not type(cells) is list:
@@ -132,7 +139,7 @@ class CaptureAgent(Agent):
         self.display.debugDraw(cells, color, clear)
 
   def debugClear(self):
-    if self.display:
+    if self.display and 'captureGraphicsDisplay' in sys.modules:
       from captureGraphicsDisplay import PacmanGraphics
       if isinstance(self.display, PacmanGraphics):
         self.display.clearDebug()
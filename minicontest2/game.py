@@ -35,7 +35,13 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+
+    Every move, Game hands the agent its own deep copy of the state, unless
+    the agent sets mutatesObservations to False, promising only to read the
+    states it is given (generating successors is fine; editing them is not).
     """
+    mutatesObservations = True
+
     def __init__(self, index=0):
         self.index = index
 
@@ -190,6 +196,7 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
+        if isinstance(other, BitGrid): return other == self
         return self.data == other.data
 
     def __hash__(self):
@@ -231,22 +238,21 @@ class Grid:
         Returns an efficient int list representation
 
         (width, height, bitPackedInts...)
+
+        Cell i (counting up each column in turn) is bit CELLS_PER_INT - 1 -
+        i % CELLS_PER_INT of int i // CELLS_PER_INT.
         """
+        cells = ''.join(['1' if value else '0' for column in self.data for value in column])
+        size = self.CELLS_PER_INT
         bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
+        for start in range(0, len(cells), size):
+            bits.append(int(cells[start:start + size].ljust(size, '0'), 2))
+        if len(cells) % size == 0:
+            bits.append(0)
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -254,25 +260,12 @@ class Grid:
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
-        for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
-
-    def _unpackInt(self, packed, size):
-        bools = []
-        if packed < 0: raise ValueError("must be a positive integer")
-        for i in range(size):
-            n = 2 ** (self.CELLS_PER_INT - i - 1)
-            if packed >= n:
-                bools.append(True)
-                packed -= n
-            else:
-                bools.append(False)
-        return bools
+        if min(bits) < 0:
+            raise ValueError("must be a positive integer")
+        cells = ''.join([format(packed, '0%db' % self.CELLS_PER_INT) for packed in bits])
+        for x in range(self.width):
+            column = cells[x * self.height:(x + 1) * self.height]
+            self.data[x] = [cell == '1' for cell in column]
 
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
@@ -280,6 +273,150 @@ def reconstituteGrid(bitRep):
     width, height = bitRep[:2]
     return Grid(width, height, bitRepresentation= bitRep[2:])
 
+class BitGrid:
+    """
+    A boolean Grid packed into a single Python int (a bitboard).  It offers the
+    same grid[x][y], count(), asList() and copy() interface as Grid.
+
+    Cell (x,y) is stored in bit x * height + y, the same ordering Grid.__hash__
+    uses, so a BitGrid and a Grid holding the same cells hash alike.  Python
+    ints are immutable, so copies simply share the int: copy() is O(1) and a
+    write rebinds self.bits without touching any other copy.  This makes it
+    cheap for successor states to share food with their parent.
+    """
+
+    def __init__(self, width, height, initialValue=False, bits=0):
+        if initialValue not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+        self.width = width
+        self.height = height
+        if initialValue:
+            bits = (1 << (width * height)) - 1
+        self.bits = bits
+
+    def fromGrid(grid):
+        """
+        Builds a BitGrid holding the same cells as a list-backed Grid.
+        """
+        bits = 0
+        base = 1
+        for column in grid.data:
+            for cell in column:
+                if cell:
+                    bits |= base
+                base <<= 1
+        return BitGrid(grid.width, grid.height, bits=bits)
+    fromGrid = staticmethod(fromGrid)
+
+    def toGrid(self):
+        g = Grid(self.width, self.height)
+        for x, y in self.asList():
+            g.data[x][y] = True
+        return g
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.width
+        if x < 0 or x >= self.width:
+            raise IndexError('BitGrid column out of range')
+        return _BitGridColumn(self, x)
+
+    def __setitem__(self, x, column):
+        for y, value in enumerate(column):
+            self._set(x * self.height + y, value)
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield _BitGridColumn(self, x)
+
+    def __len__(self):
+        return self.width
+
+    def _set(self, index, value):
+        if value:
+            self.bits |= 1 << index
+        else:
+            self.bits &= ~(1 << index)
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)]
+               for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None:
+            return False
+        if isinstance(other, Grid):
+            other = BitGrid.fromGrid(other)
+        return self.width == other.width and self.height == other.height and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def copy(self):
+        return BitGrid(self.width, self.height, bits=self.bits)
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item=True):
+        ones = bin(self.bits).count('1')
+        if item:
+            return ones
+        return self.width * self.height - ones
+
+    def asList(self, key=True):
+        bits = self.bits
+        if not key:
+            bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        list = []
+        height = self.height
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            list.append((index // height, index % height))
+            bits ^= low
+        return list
+
+    def packBits(self):
+        return self.toGrid().packBits()
+
+
+class _BitGridColumn:
+    """
+    The grid[x] view of a BitGrid, so that grid[x][y] reads and writes work.
+    """
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def __getitem__(self, y):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if y < 0 or y >= height:
+            raise IndexError('BitGrid row out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0:
+            y += self.grid.height
+        self.grid._set(self.offset + y, value)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        bits = self.grid.bits >> self.offset
+        for y in range(self.grid.height):
+            yield (bits >> y) & 1 == 1
+
 ####################################
 # Parts you shouldn't have to read #
 ####################################
@@ -488,7 +625,7 @@ class GameStateData:
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.food = layout.food.copy()
+        self.food = BitGrid.fromGrid(layout.food)
         #self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
@@ -510,6 +647,29 @@ try:
 except:
     _BOINC_ENABLED = False
 
+class AgentOutput:
+    """
+    Stands in for sys.stdout or sys.stderr while a game with muted agents
+    runs.  Text goes to the buffer of agentIndex, the agent currently
+    running, or to the original stream when no agent is.
+    """
+    def __init__(self, buffers, stream):
+        self.buffers = buffers
+        self.stream = stream
+        self.agentIndex = None
+
+    def write(self, text):
+        if self.agentIndex == None:
+            return self.stream.write(text)
+        return self.buffers[self.agentIndex].write(text)
+
+    def flush(self):
+        if self.agentIndex == None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
@@ -530,6 +690,9 @@ class Game:
         self.agentTimeout = False
         import io
         self.agentOutput = [io.StringIO() for agent in agents]
+        # The AgentOutput streams standing in for stdout and stderr while
+        # a game with muted agents runs
+        self.mutedStreams = None
 
     def getProgress(self):
         if self.gameOver:
@@ -544,30 +707,60 @@ class Game:
         self.agentCrashed = True
         self.rules.agentCrash(self, agentIndex)
 
-    OLD_STDOUT = None
-    OLD_STDERR = None
-
     def mute(self, agentIndex):
-        if not self.muteAgents: return
-        global OLD_STDOUT, OLD_STDERR
-        import io
-        OLD_STDOUT = sys.stdout
-        OLD_STDERR = sys.stderr
-        sys.stdout = self.agentOutput[agentIndex]
-        sys.stderr = self.agentOutput[agentIndex]
+        "Sends what agentIndex prints to its agentOutput buffer"
+        if self.mutedStreams == None: return
+        for stream in self.mutedStreams:
+            stream.agentIndex = agentIndex
 
     def unmute(self):
-        if not self.muteAgents: return
-        global OLD_STDOUT, OLD_STDERR
-        # Revert stdout/stderr to originals
-        sys.stdout = OLD_STDOUT
-        sys.stderr = OLD_STDERR
-
+        if self.mutedStreams == None: return
+        for stream in self.mutedStreams:
+            stream.agentIndex = None
+
+    def _startMuting(self):
+        self.mutedStreams = [AgentOutput(self.agentOutput, sys.stdout),
+                             AgentOutput(self.agentOutput, sys.stderr)]
+        sys.stdout, sys.stderr = self.mutedStreams
+
+    def _stopMuting(self):
+        if sys.stdout is self.mutedStreams[0]:
+            sys.stdout = self.mutedStreams[0].stream
+        if sys.stderr is self.mutedStreams[1]:
+            sys.stderr = self.mutedStreams[1].stream
+        self.mutedStreams = None
+
+    def _observe(self, agentIndex):
+        "The state to hand agentIndex: a copy, unless the agent only reads it"
+        if self.copyObservations[agentIndex]:
+            return self.state.deepCopy()
+        return self.state
+
+    def _agentMethods(self, name):
+        "Each agent's method called name, or None for agents without one"
+        return [getattr(agent, name, None) for agent in self.agents]
 
     def run( self ):
         """
         Main control loop for game play.
         """
+        # Agents' output is redirected once for the whole game; mute and
+        # unmute then only say whose buffer it goes to
+        if self.muteAgents:
+            self._startMuting()
+        try:
+            self._run()
+        finally:
+            if self.mutedStreams != None:
+                self._stopMuting()
+
+    def _run( self ):
+        # What each agent implements, looked up once rather than every move
+        registerInitialState = self._agentMethods('registerInitialState')
+        observationFunction = self._agentMethods('observationFunction')
+        final = self._agentMethods('final')
+        self.copyObservations = [getattr(agent, 'mutatesObservations', True) for agent in self.agents]
+
         self.display.initialize(self.state.data)
         self.numMoves = 0
 
@@ -583,28 +776,34 @@ class Game:
                 self.unmute()
                 self._agentCrash(i, quiet=True)
                 return
-            if ("registerInitialState" in dir(agent)):
+            if registerInitialState[i] != None:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(registerInitialState[i], self.rules.getMaxStartupTime(i))
                         try:
                             start_time = time.time()
                             timed_func(self.state.deepCopy())
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
-                        except TimeoutFunctionException:
+                        except TimeoutFunctionException as e:
+                            if not timed_func.ownsTimeout(e):
+                                raise
                             print("Agent %d ran out of time on startup!" % i, file=sys.stderr)
                             self.unmute()
                             self.agentTimeout = True
                             self._agentCrash(i, quiet=True)
                             return
+                    except TimeoutFunctionException:
+                        # An enclosing deadline passed
+                        self.unmute()
+                        raise
                     except Exception as data:
                         self._agentCrash(i, quiet=False)
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    registerInitialState[i](self.state.deepCopy())
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -617,40 +816,48 @@ class Game:
             move_time = 0
             skip_action = False
             # Generate an observation of the state
-            if 'observationFunction' in dir( agent ):
+            if observationFunction[agentIndex] != None:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(observationFunction[agentIndex], self.rules.getMoveTimeout(agentIndex))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
-                        except TimeoutFunctionException:
+                            observation = timed_func(self._observe(agentIndex))
+                        except TimeoutFunctionException as e:
+                            if not timed_func.ownsTimeout(e):
+                                raise
                             skip_action = True
                         move_time += time.time() - start_time
                         self.unmute()
+                    except TimeoutFunctionException:
+                        # An enclosing deadline passed
+                        self.unmute()
+                        raise
                     except Exception as data:
                         self._agentCrash(agentIndex, quiet=False)
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = observationFunction[agentIndex](self._observe(agentIndex))
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self._observe(agentIndex)
 
             # Solicit an action
             action = None
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time)
                     try:
                         start_time = time.time()
                         if skip_action:
                             raise TimeoutFunctionException()
                         action = timed_func( observation )
-                    except TimeoutFunctionException:
+                    except TimeoutFunctionException as e:
+                        if not timed_func.ownsTimeout(e):
+                            raise
                         print("Agent %d timed out on a single move!" % agentIndex, file=sys.stderr)
                         self.agentTimeout = True
                         self._agentCrash(agentIndex, quiet=True)
@@ -678,6 +885,10 @@ class Game:
                         self.unmute()
                         return
                     self.unmute()
+                except TimeoutFunctionException:
+                    # An enclosing deadline passed
+                    self.unmute()
+                    raise
                 except Exception as data:
                     self._agentCrash(agentIndex)
                     self.unmute()
@@ -716,10 +927,10 @@ class Game:
 
         # inform a learning agent of the game result
         for agentIndex, agent in enumerate(self.agents):
-            if "final" in dir( agent ) :
+            if final[agentIndex] != None:
                 try:
                     self.mute(agentIndex)
-                    agent.final( self.state )
+                    final[agentIndex]( self.state )
                     self.unmute()
                 except Exception as data:
                     if not self.catchExceptions: raise
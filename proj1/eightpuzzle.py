@@ -14,6 +14,9 @@
 
 import search
 import random
+import os
+import struct
+from collections import deque
 
 # Module Classes
 
@@ -46,18 +49,28 @@ class EightPuzzleState:
             | 6 | 7 | 8 |
             ------------
 
-        The configuration of the puzzle is stored in a 2-dimensional
-        list (a list of lists) 'cells'.
+        Any square number of numbers makes a puzzle of that size: 16 of
+        them (0 to 15) make a fifteen puzzle, 4 rows of 4.
+
+        The configuration of the puzzle is stored as the tuple
+        'numbers', row by row, with the blank at 'blankIndex'.  'cells'
+        and 'blankLocation' give the same as a list of rows and a
+        (row, col) pair.
         """
-        self.cells = []
-        numbers = numbers[:] # Make a copy so as not to cause side-effects.
-        numbers.reverse()
-        for row in range( 3 ):
-            self.cells.append( [] )
-            for col in range( 3 ):
-                self.cells[row].append( numbers.pop() )
-                if self.cells[row][col] == 0:
-                    self.blankLocation = row, col
+        self.numbers = tuple(numbers)
+        self.size = int(round(len(self.numbers) ** 0.5))
+        if self.size * self.size != len(self.numbers):
+            raise Exception('A puzzle needs a square number of cells, not %d' % len(self.numbers))
+        self.blankIndex = self.numbers.index(0)
+
+    @property
+    def cells( self ):
+        size = self.size
+        return [list(self.numbers[row * size:(row + 1) * size]) for row in range( size )]
+
+    @property
+    def blankLocation( self ):
+        return divmod(self.blankIndex, self.size)
 
     def isGoal( self ):
         """
@@ -77,12 +90,9 @@ class EightPuzzleState:
         >>> EightPuzzleState([1, 0, 2, 3, 4, 5, 6, 7, 8]).isGoal()
         False
         """
-        current = 0
-        for row in range( 3 ):
-            for col in range( 3 ):
-                if current != self.cells[row][col]:
-                    return False
-                current += 1
+        for current, number in enumerate(self.numbers):
+            if current != number:
+                return False
         return True
 
     def legalMoves( self ):
@@ -99,11 +109,11 @@ class EightPuzzleState:
         row, col = self.blankLocation
         if(row != 0):
             moves.append('up')
-        if(row != 2):
+        if(row != self.size - 1):
             moves.append('down')
         if(col != 0):
             moves.append('left')
-        if(col != 2):
+        if(col != self.size - 1):
             moves.append('right')
         return moves
 
@@ -113,8 +123,7 @@ class EightPuzzleState:
         updated based on the provided move.
 
         The move should be a string drawn from a list returned by legalMoves.
-        Illegal moves will raise an exception, which may be an array bounds
-        exception.
+        Illegal moves will raise an exception.
 
         NOTE: This function *does not* change the current object.  Instead,
         it returns a new object.
@@ -133,17 +142,31 @@ class EightPuzzleState:
             newrow = row
             newcol = col + 1
         else:
-            raise "Illegal Move"
+            raise Exception("Illegal Move")
+        if not (0 <= newrow < self.size and 0 <= newcol < self.size):
+            raise Exception("Illegal Move")
+
+        # Swap the blank with the number it moves onto
+        newIndex = newrow * self.size + newcol
+        numbers = list(self.numbers)
+        numbers[self.blankIndex] = numbers[newIndex]
+        numbers[newIndex] = 0
+        newPuzzle = EightPuzzleState.__new__(EightPuzzleState)
+        newPuzzle.numbers = tuple(numbers)
+        newPuzzle.size = self.size
+        newPuzzle.blankIndex = newIndex
+        return newPuzzle
 
-        # Create a copy of the current eightPuzzle
-        newPuzzle = EightPuzzleState([0, 0, 0, 0, 0, 0, 0, 0, 0])
-        newPuzzle.cells = [values[:] for values in self.cells]
-        # And update it to reflect the move
-        newPuzzle.cells[row][col] = self.cells[newrow][newcol]
-        newPuzzle.cells[newrow][newcol] = self.cells[row][col]
-        newPuzzle.blankLocation = newrow, newcol
+    def getRank( self ):
+        """
+          The position of this configuration among all the orderings of its
+        numbers, in lexicographic order (see permutationRank).
+        loadPuzzleFromRank turns it back into a puzzle.
 
-        return newPuzzle
+        >>> EightPuzzleState([0, 1, 2, 3, 4, 5, 6, 7, 8]).getRank()
+        0
+        """
+        return permutationRank(self.numbers)
 
     # Utilities for comparison and display
     def __eq__(self, other):
@@ -155,27 +178,25 @@ class EightPuzzleState:
               EightPuzzleState([1, 0, 2, 3, 4, 5, 6, 7, 8]).result('left')
           True
         """
-        for row in range( 3 ):
-            if self.cells[row] != other.cells[row]:
-                return False
-        return True
+        return self.numbers == other.numbers
 
     def __hash__(self):
-        return hash(str(self.cells))
+        return hash(self.numbers)
 
     def __getAsciiString(self):
         """
           Returns a display string for the maze
         """
         lines = []
-        horizontalLine = ('-' * (13))
+        width = len(str(len(self.numbers) - 1))
+        horizontalLine = ('-' * ((width + 3) * self.size + 1))
         lines.append(horizontalLine)
         for row in self.cells:
             rowLine = '|'
             for col in row:
                 if col == 0:
                     col = ' '
-                rowLine = rowLine + ' ' + col.__str__() + ' |'
+                rowLine = rowLine + ' ' + col.__str__().rjust(width) + ' |'
             lines.append(rowLine)
             lines.append(horizontalLine)
         return '\n'.join(lines)
@@ -183,7 +204,39 @@ class EightPuzzleState:
     def __str__(self):
         return self.__getAsciiString()
 
-# TODO: Implement The methods in this class
+def permutationRank(numbers):
+    """
+      numbers: an ordering of the integers 0 to n-1
+
+    Returns the position of numbers among the n! orderings of 0 to n-1 in
+    lexicographic order, an integer from 0 to n!-1 (the Lehmer code of the
+    ordering, read as a factorial-base number).
+
+    >>> permutationRank([0, 1, 2]), permutationRank([2, 1, 0])
+    (0, 5)
+    """
+    rank = 0
+    remaining = sorted(numbers)
+    for number in numbers:
+        index = remaining.index(number)
+        rank = rank * len(remaining) + index
+        del remaining[index]
+    return rank
+
+def permutationFromRank(rank, n):
+    """
+      The ordering of 0 to n-1 that permutationRank gives rank.
+
+    >>> permutationFromRank(5, 3)
+    [2, 1, 0]
+    """
+    digits = []
+    for radix in range(1, n + 1):
+        rank, digit = divmod(rank, radix)
+        digits.append(digit)
+    digits.reverse()
+    remaining = list(range(n))
+    return [remaining.pop(digit) for digit in digits]
 
 class EightPuzzleSearchProblem(search.SearchProblem):
     """
@@ -196,11 +249,15 @@ class EightPuzzleSearchProblem(search.SearchProblem):
         self.puzzle = puzzle
 
     def getStartState(self):
-        return puzzle
+        return self.puzzle
 
     def isGoalState(self,state):
         return state.isGoal()
 
+    def getStateKey(self, state):
+        "The searches remember states by their rank, a single int"
+        return state.getRank()
+
     def getSuccessors(self,state):
         """
           Returns list of (successor, action, stepCost) pairs where
@@ -221,6 +278,139 @@ class EightPuzzleSearchProblem(search.SearchProblem):
         """
         return len(actions)
 
+# Pattern databases
+
+PATTERN_DATABASE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__puzzlecache__')
+PATTERN_DATABASE_MAGIC = b'PACPDB2\n'
+_PATTERN_HEADER = struct.Struct('<8sBB')
+
+# Disjoint tile groups whose pattern database distances add up to an
+# admissible heuristic, for each puzzle size
+DEFAULT_PATTERNS = {3: [(1, 2, 3, 4), (5, 6, 7, 8)],
+                    4: [(1, 2, 3, 4), (5, 6, 7, 8), (9, 10, 11, 12), (13, 14, 15)]}
+
+PATTERN_DATABASES = {}
+
+class PatternDatabase:
+    """
+      An additive pattern database heuristic for the puzzles of one size.
+
+    The tiles are split into disjoint groups (patterns).  For each pattern
+    a table holds, for every placement of its tiles and the blank, the
+    fewest moves *of those tiles* that bring them all home, the other tiles
+    being free to move.  No move is counted by two patterns, so the sum
+    over the patterns is admissible, and since one move changes it by at
+    most one it is consistent as well.  Tables are built once (a
+    breadth-first search over the placements) and cached on disk in
+    PATTERN_DATABASE_DIRECTORY.
+    """
+    def __init__(self, size, patterns=None):
+        if patterns == None:
+            patterns = DEFAULT_PATTERNS[size]
+        self.size = size
+        self.patterns = [tuple(pattern) for pattern in patterns]
+        self.tables = [loadPatternTable(size, pattern) for pattern in self.patterns]
+
+    def getDistance(self, puzzle):
+        "The heuristic value of an EightPuzzleState of this size"
+        cells = len(puzzle.numbers)
+        where = [0] * cells
+        for cell, number in enumerate(puzzle.numbers):
+            where[number] = cell
+        distance = 0
+        for pattern, table in zip(self.patterns, self.tables):
+            index = 0
+            for tile in pattern:
+                index = index * cells + where[tile]
+            distance += table[index * cells + puzzle.blankIndex]
+        return distance
+
+def patternDatabaseHeuristic(state, problem=None):
+    """
+      The PatternDatabase heuristic with the DEFAULT_PATTERNS for the
+    state's size, loaded the first time it is needed.
+    """
+    if state.size not in PATTERN_DATABASES:
+        PATTERN_DATABASES[state.size] = PatternDatabase(state.size)
+    return PATTERN_DATABASES[state.size].getDistance(state)
+
+def buildPatternTable(size, pattern):
+    """
+      Returns a bytearray, indexed by the cells of the tiles of pattern and
+    then of the blank (in order, as the digits of a number in base
+    size*size), of the fewest moves of those tiles that bring them home.
+    Moves of other tiles cost nothing, so this is a breadth-first search
+    that puts free moves at the front of the queue.
+    """
+    cells = size * size
+    numTiles = len(pattern)
+    neighbors = []
+    for cell in range(cells):
+        row, col = divmod(cell, size)
+        neighbors.append([r * size + c for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1))
+                          if 0 <= r < size and 0 <= c < size])
+    unseen = 255
+    # The search starts from home: tile t in cell t, and the blank in cell 0
+    distances = bytearray([unseen]) * (cells ** numTiles * cells)
+    home = tuple(pattern)
+    homeIndex = 0
+    for cell in home:
+        homeIndex = homeIndex * cells + cell
+    distances[homeIndex * cells] = 0
+    queue = deque([(home, homeIndex, 0)])
+    while len(queue) > 0:
+        placement, index, blank = queue.popleft()
+        distance = distances[index * cells + blank]
+        for cell in neighbors[blank]:
+            if cell in placement:
+                # A pattern tile slides into the blank: one move
+                tile = placement.index(cell)
+                newPlacement = placement[:tile] + (blank,) + placement[tile + 1:]
+                newIndex = index + (blank - cell) * cells ** (numTiles - 1 - tile)
+                if distance + 1 < distances[newIndex * cells + cell]:
+                    distances[newIndex * cells + cell] = distance + 1
+                    queue.append((newPlacement, newIndex, cell))
+            elif distance < distances[index * cells + cell]:
+                distances[index * cells + cell] = distance
+                queue.appendleft((placement, index, cell))
+    return distances
+
+def loadPatternTable(size, pattern):
+    """
+      Returns the table buildPatternTable makes, reading it from
+    PATTERN_DATABASE_DIRECTORY if it was saved there and saving it if not.
+    A directory that cannot be written is not an error.
+    """
+    path = os.path.join(PATTERN_DATABASE_DIRECTORY,
+                        'pattern-%d-%s.bin' % (size, '-'.join([str(tile) for tile in pattern])))
+    header = _PATTERN_HEADER.pack(PATTERN_DATABASE_MAGIC, size, len(pattern))
+    tableSize = (size * size) ** (len(pattern) + 1)
+    try:
+        f = open(path, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        if data[:len(header)] == header and len(data) == len(header) + tableSize:
+            return bytearray(data[len(header):])
+    except OSError:
+        pass
+    table = buildPatternTable(size, pattern)
+    try:
+        os.makedirs(PATTERN_DATABASE_DIRECTORY, exist_ok=True)
+        # Write to a temporary name, so readers never see a partial file
+        temporaryPath = '%s.%d' % (path, os.getpid())
+        f = open(temporaryPath, 'wb')
+        try:
+            f.write(header)
+            f.write(table)
+        finally:
+            f.close()
+        os.replace(temporaryPath, path)
+    except OSError:
+        pass
+    return table
+
 EIGHT_PUZZLE_DATA = [[1, 0, 2, 3, 4, 5, 6, 7, 8],
                      [1, 7, 8, 2, 3, 4, 5, 6, 0],
                      [4, 3, 2, 7, 0, 5, 1, 6, 8],
@@ -248,15 +438,25 @@ def loadEightPuzzle(puzzleNumber):
     """
     return EightPuzzleState(EIGHT_PUZZLE_DATA[puzzleNumber])
 
-def createRandomEightPuzzle(moves=100):
+def loadPuzzleFromRank(rank, size=3):
+    """
+      Returns the puzzle with size rows whose getRank() is rank.
+
+      >>> loadPuzzleFromRank(loadEightPuzzle(3).getRank()) == loadEightPuzzle(3)
+      True
+    """
+    return EightPuzzleState(permutationFromRank(rank, size * size))
+
+def createRandomEightPuzzle(moves=100, size=3):
     """
       moves: number of random moves to apply
+      size: the number of rows (4 for a fifteen puzzle)
 
       Creates a random eight puzzle by applying
       a series of 'moves' random moves to a solved
       puzzle.
     """
-    puzzle = EightPuzzleState([0,1,2,3,4,5,6,7,8])
+    puzzle = EightPuzzleState(list(range(size * size)))
     for i in range(moves):
         # Execute a random legal move
         puzzle = puzzle.result(random.sample(puzzle.legalMoves(), 1)[0])
@@ -190,6 +190,7 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
+        if isinstance(other, BitGrid): return other == self
         return self.data == other.data
 
     def __hash__(self):
@@ -231,18 +232,17 @@ class Grid:
         Returns an efficient int list representation
 
         (width, height, bitPackedInts...)
+
+        Cell i (counting up each column in turn) is bit CELLS_PER_INT - 1 -
+        i % CELLS_PER_INT of int i // CELLS_PER_INT.
         """
+        cells = ''.join(['1' if value else '0' for column in self.data for value in column])
+        size = self.CELLS_PER_INT
         bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
+        for start in range(0, len(cells), size):
+            bits.append(int(cells[start:start + size].ljust(size, '0'), 2))
+        if len(cells) % size == 0:
+            bits.append(0)
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
@@ -254,25 +254,12 @@ class Grid:
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
-        for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
-
-    def _unpackInt(self, packed, size):
-        bools = []
-        if packed < 0: raise ValueError("must be a positive integer")
-        for i in range(size):
-            n = 2 ** (self.CELLS_PER_INT - i - 1)
-            if packed >= n:
-                bools.append(True)
-                packed -= n
-            else:
-                bools.append(False)
-        return bools
+        if min(bits) < 0:
+            raise ValueError("must be a positive integer")
+        cells = ''.join([format(packed, '0%db' % self.CELLS_PER_INT) for packed in bits])
+        for x in range(self.width):
+            column = cells[x * self.height:(x + 1) * self.height]
+            self.data[x] = [cell == '1' for cell in column]
 
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
@@ -280,6 +267,150 @@ def reconstituteGrid(bitRep):
     width, height = bitRep[:2]
     return Grid(width, height, bitRepresentation= bitRep[2:])
 
+class BitGrid:
+    """
+    A boolean Grid packed into a single Python int (a bitboard).  It offers the
+    same grid[x][y], count(), asList() and copy() interface as Grid.
+
+    Cell (x,y) is stored in bit x * height + y, the same ordering Grid.__hash__
+    uses, so a BitGrid and a Grid holding the same cells hash alike.  Python
+    ints are immutable, so copies simply share the int: copy() is O(1) and a
+    write rebinds self.bits without touching any other copy.  This makes it
+    cheap for successor states to share food with their parent.
+    """
+
+    def __init__(self, width, height, initialValue=False, bits=0):
+        if initialValue not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+        self.width = width
+        self.height = height
+        if initialValue:
+            bits = (1 << (width * height)) - 1
+        self.bits = bits
+
+    def fromGrid(grid):
+        """
+        Builds a BitGrid holding the same cells as a list-backed Grid.
+        """
+        bits = 0
+        base = 1
+        for column in grid.data:
+            for cell in column:
+                if cell:
+                    bits |= base
+                base <<= 1
+        return BitGrid(grid.width, grid.height, bits=bits)
+    fromGrid = staticmethod(fromGrid)
+
+    def toGrid(self):
+        g = Grid(self.width, self.height)
+        for x, y in self.asList():
+            g.data[x][y] = True
+        return g
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.width
+        if x < 0 or x >= self.width:
+            raise IndexError('BitGrid column out of range')
+        return _BitGridColumn(self, x)
+
+    def __setitem__(self, x, column):
+        for y, value in enumerate(column):
+            self._set(x * self.height + y, value)
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield _BitGridColumn(self, x)
+
+    def __len__(self):
+        return self.width
+
+    def _set(self, index, value):
+        if value:
+            self.bits |= 1 << index
+        else:
+            self.bits &= ~(1 << index)
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)]
+               for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None:
+            return False
+        if isinstance(other, Grid):
+            other = BitGrid.fromGrid(other)
+        return self.width == other.width and self.height == other.height and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def copy(self):
+        return BitGrid(self.width, self.height, bits=self.bits)
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item=True):
+        ones = bin(self.bits).count('1')
+        if item:
+            return ones
+        return self.width * self.height - ones
+
+    def asList(self, key=True):
+        bits = self.bits
+        if not key:
+            bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        list = []
+        height = self.height
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            list.append((index // height, index % height))
+            bits ^= low
+        return list
+
+    def packBits(self):
+        return self.toGrid().packBits()
+
+
+class _BitGridColumn:
+    """
+    The grid[x] view of a BitGrid, so that grid[x][y] reads and writes work.
+    """
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def __getitem__(self, y):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if y < 0 or y >= height:
+            raise IndexError('BitGrid row out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0:
+            y += self.grid.height
+        self.grid._set(self.offset + y, value)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        bits = self.grid.bits >> self.offset
+        for y in range(self.grid.height):
+            yield (bits >> y) & 1 == 1
+
 ####################################
 # Parts you shouldn't have to read #
 ####################################
@@ -338,6 +469,10 @@ class Actions:
         if (abs(x - x_int) + abs(y - y_int)  > Actions.TOLERANCE):
             return [config.getDirection()]
 
+        moveTable = getattr(walls, 'moveTable', None)
+        if moveTable != None:
+            return list(moveTable.actions[x_int * walls.height + y_int])
+
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
             next_y = y_int + dy
@@ -351,6 +486,9 @@ class Actions:
     def getLegalNeighbors(position, walls):
         x,y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
+        moveTable = getattr(walls, 'moveTable', None)
+        if moveTable != None and 0 <= x_int < walls.width and 0 <= y_int < walls.height:
+            return list(moveTable.neighbors[x_int * walls.height + y_int])
         neighbors = []
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
@@ -368,6 +506,56 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+class MoveTable:
+    """
+    The legal moves on a fixed wall Grid, compiled once.  Every table is a list
+    indexed by cell id x * height + y:
+
+      actions[cell]    the directions Actions.getPossibleActions allows
+      neighbors[cell]  the cells Actions.getLegalNeighbors returns
+      successors[cell] (nextPosition, direction) pairs for the four compass
+                       moves, in the North, South, East, West order search
+                       problems expand in
+      forward[cell]    direction of travel -> the moves of an agent that can
+                       neither stop nor turn around unless at a dead end
+
+    A Layout compiles its walls into walls.moveTable, after which the Actions
+    helpers read from the table instead of probing the walls.  The walls must
+    not change afterwards.
+    """
+    def __init__(self, walls):
+        width, height = walls.width, walls.height
+        self.width = width
+        self.height = height
+        self.actions = []
+        self.neighbors = []
+        self.successors = []
+        self.forward = []
+        compass = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+
+        def isOpen(x, y):
+            return 0 <= x < width and 0 <= y < height and not walls[x][y]
+
+        for x in range(width):
+            for y in range(height):
+                moves = [(dir, (x + dx, y + dy)) for dir, (dx, dy) in Actions._directionsAsList
+                         if isOpen(x + dx, y + dy)]
+                actions = tuple([dir for dir, next in moves])
+                self.actions.append(actions)
+                self.neighbors.append(tuple([next for dir, next in moves]))
+                nextByDirection = dict(moves)
+                self.successors.append(tuple([(nextByDirection[dir], dir)
+                                              for dir in compass if dir in nextByDirection]))
+                forward = {}
+                turns = [dir for dir in actions if dir != Directions.STOP]
+                for heading in Actions._directions:
+                    reverse = Directions.REVERSE[heading]
+                    if reverse in turns and len(turns) > 1:
+                        forward[heading] = tuple([dir for dir in turns if dir != reverse])
+                    else:
+                        forward[heading] = tuple(turns)
+                self.forward.append(forward)
+
 class GameStateData:
     """
 
@@ -488,7 +676,7 @@ class GameStateData:
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.food = layout.food.copy()
+        self.food = BitGrid.fromGrid(layout.food)
         #self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
@@ -587,18 +775,24 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(agent.registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
                             start_time = time.time()
                             timed_func(self.state.deepCopy())
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
-                        except TimeoutFunctionException:
+                        except TimeoutFunctionException as e:
+                            if not timed_func.ownsTimeout(e):
+                                raise
                             print("Agent %d ran out of time on startup!" % i, file=sys.stderr)
                             self.unmute()
                             self.agentTimeout = True
                             self._agentCrash(i, quiet=True)
                             return
+                    except TimeoutFunctionException:
+                        # An enclosing deadline passed
+                        self.unmute()
+                        raise
                     except Exception as data:
                         self._agentCrash(i, quiet=False)
                         self.unmute()
@@ -621,14 +815,20 @@ class Game:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(agent.observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
                             start_time = time.time()
                             observation = timed_func(self.state.deepCopy())
-                        except TimeoutFunctionException:
+                        except TimeoutFunctionException as e:
+                            if not timed_func.ownsTimeout(e):
+                                raise
                             skip_action = True
                         move_time += time.time() - start_time
                         self.unmute()
+                    except TimeoutFunctionException:
+                        # An enclosing deadline passed
+                        self.unmute()
+                        raise
                     except Exception as data:
                         self._agentCrash(agentIndex, quiet=False)
                         self.unmute()
@@ -644,13 +844,15 @@ class Game:
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time)
                     try:
                         start_time = time.time()
                         if skip_action:
                             raise TimeoutFunctionException()
                         action = timed_func( observation )
-                    except TimeoutFunctionException:
+                    except TimeoutFunctionException as e:
+                        if not timed_func.ownsTimeout(e):
+                            raise
                         print("Agent %d timed out on a single move!" % agentIndex, file=sys.stderr)
                         self.agentTimeout = True
                         self._agentCrash(agentIndex, quiet=True)
@@ -678,6 +880,10 @@ class Game:
                         self.unmute()
                         return
                     self.unmute()
+                except TimeoutFunctionException:
+                    # An enclosing deadline passed
+                    self.unmute()
+                    raise
                 except Exception as data:
                     self._agentCrash(agentIndex)
                     self.unmute()
@@ -46,7 +46,7 @@ from game import Actions
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
-import sys, types, time, random, os
+import sys, types, time, random, os, re
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
@@ -71,14 +71,38 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
+    # Optional bookkeeping of the states generateSuccessor visits, which the
+    # graders use to count the states an agent explores.  It is off unless
+    # setExploredTracking turns it on, and then keeps at most exploredLimit
+    # distinct states (all of them if the limit is None) in explored, and the
+    # number of generateSuccessor calls in exploredCount.
+    trackExplored = False
+    exploredLimit = None
     explored = set()
+    exploredCount = 0
+
+    def setExploredTracking(enabled=True, limit=None):
+        GameState.trackExplored = enabled
+        GameState.exploredLimit = limit
+        GameState.getAndResetExplored()
+    setExploredTracking = staticmethod(setExploredTracking)
+
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
+        tmp = GameState.explored
         GameState.explored = set()
+        GameState.exploredCount = 0
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def recordExplored(parent, child):
+        GameState.exploredCount += 1
+        limit = GameState.exploredLimit
+        if limit == None or len(GameState.explored) < limit:
+            GameState.explored.add(parent)
+        if limit == None or len(GameState.explored) < limit:
+            GameState.explored.add(child)
+    recordExplored = staticmethod(recordExplored)
+
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
@@ -120,8 +144,8 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.trackExplored:
+            GameState.recordExplored(self, state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -584,6 +608,33 @@ def readCommand( argv ):
 
     return args
 
+# Index of the names defined in the *gents.py files of each directory, keyed
+# by the directory and the files' modification times
+_AGENT_MODULE_INDEX = {}
+_DEFINITION = re.compile(r'^(?:class|def)\s+(\w+)', re.MULTILINE)
+
+def buildAgentIndex(moduleDir):
+    """
+    Maps each class or function defined at the top level of a *gents.py file
+    in moduleDir to the name of its module.  The files are read as text, not
+    imported, so looking an agent up imports only the module defining it.
+    """
+    moduleNames = sorted([f for f in os.listdir(moduleDir) if f.endswith('gents.py')])
+    key = (os.path.abspath(moduleDir),
+           tuple([(f, os.path.getmtime(os.path.join(moduleDir, f))) for f in moduleNames]))
+    if key not in _AGENT_MODULE_INDEX:
+        index = {}
+        for modulename in moduleNames:
+            f = open(os.path.join(moduleDir, modulename))
+            try:
+                source = f.read()
+            finally:
+                f.close()
+            for name in _DEFINITION.findall(source):
+                index.setdefault(name, modulename[:-3])
+        _AGENT_MODULE_INDEX[key] = index
+    return _AGENT_MODULE_INDEX[key]
+
 def loadAgent(pacman, nographics):
     # Looks through all pythonPath Directories for the right module,
     pythonPathStr = os.path.expandvars("$PYTHONPATH")
@@ -592,19 +643,26 @@ def loadAgent(pacman, nographics):
     else:
         pythonPathDirs = pythonPathStr.split(';')
     pythonPathDirs.append('.')
-
-    for moduleDir in pythonPathDirs:
-        if not os.path.isdir(moduleDir): continue
-        moduleNames = [f for f in os.listdir(moduleDir) if f.endswith('gents.py')]
-        for modulename in moduleNames:
-            try:
-                module = __import__(modulename[:-3])
-            except ImportError:
-                continue
-            if pacman in dir(module):
-                if nographics and modulename == 'keyboardAgents.py':
-                    raise Exception('Using the keyboard requires graphics (not text display)')
-                return getattr(module, pacman)
+    moduleDirs = [d for d in pythonPathDirs if os.path.isdir(d)]
+
+    # First the modules that define the agent, then (for agents that a module
+    # imports or assigns) every agent module
+    candidates = []
+    for moduleDir in moduleDirs:
+        moduleName = buildAgentIndex(moduleDir).get(pacman)
+        if moduleName != None: candidates.append(moduleName)
+    for moduleDir in moduleDirs:
+        candidates.extend([f[:-3] for f in os.listdir(moduleDir) if f.endswith('gents.py')])
+
+    for moduleName in candidates:
+        try:
+            module = __import__(moduleName)
+        except ImportError:
+            continue
+        if pacman in dir(module):
+            if nographics and moduleName == 'keyboardAgents':
+                raise Exception('Using the keyboard requires graphics (not text display)')
+            return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
 def replayGame( layout, actions, display ):
@@ -676,6 +734,9 @@ if __name__ == '__main__':
 
     > python pacman.py --help
     """
+    # Agent modules import pacman: let them use this module rather than load
+    # and run a second copy of it
+    sys.modules['pacman'] = sys.modules['__main__']
     args = readCommand( sys.argv[1:] ) # Get game components based on input
     runGames( **args )
 
@@ -37,6 +37,8 @@ Good luck and happy searching!
 from game import Directions
 from game import Agent
 from game import Actions
+from game import Grid
+from game import MoveTable
 import util
 import time
 import search
@@ -70,7 +72,7 @@ class SearchAgent(Agent):
     Options for fn include:
       depthFirstSearch or dfs
       breadthFirstSearch or bfs
-
+      bidirectionalSearch or bds (for problems with a single goal state)
 
     Note: You should NOT change any code in SearchAgent
     """
@@ -196,14 +198,21 @@ class PositionSearchProblem(search.SearchProblem):
         """
 
         successors = []
-        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
+        # Legal moves compiled by the layout (see game.MoveTable)
+        moveTable = getattr(self.walls, 'moveTable', None)
+        if moveTable != None:
             x, y = state
-            dx, dy = Actions.directionToVector(action)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextState = (nextx, nexty)
-                cost = self.costFn(nextState)
-                successors.append((nextState, action, cost))
+            for nextState, action in moveTable.successors[x * self.walls.height + y]:
+                successors.append((nextState, action, self.costFn(nextState)))
+        else:
+            for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
+                x, y = state
+                dx, dy = Actions.directionToVector(action)
+                nextx, nexty = int(x + dx), int(y + dy)
+                if not self.walls[nextx][nexty]:
+                    nextState = (nextx, nexty)
+                    cost = self.costFn(nextState)
+                    successors.append((nextState, action, cost))
 
         # Bookkeeping for display purposes
         self._expanded += 1  # DO NOT CHANGE
@@ -213,6 +222,18 @@ class PositionSearchProblem(search.SearchProblem):
 
         return successors
 
+    def getPredecessors(self, state):
+        """
+        Returns (predecessor, action, stepCost) triples for the states one move
+        away from state, with the action that leads from the predecessor to
+        state and its cost, for searching backward from the goal (see
+        search.bidirectionalSearch).
+        """
+        cost = self.costFn(state)
+        predecessors = [(nextState, Actions.reverseDirection(action), cost)
+                        for nextState, action, stepCost in self.getSuccessors(state)]
+        return predecessors
+
     def getCostOfActions(self, actions):
         """
         Returns the cost of a particular sequence of actions. If those actions
@@ -319,6 +340,12 @@ class CornersProblem(search.SearchProblem):
                 return False
         return True
 
+    def getStateKey(self, state):
+        """
+        States are dicts, so the search keys them by position and flags.
+        """
+        return state["Pos"], tuple(state["CornerFlag"])
+
     def getSuccessors(self, state):
         """
         Returns successor states, the actions they require, and a cost of 1.
@@ -556,11 +583,219 @@ def foodHeuristic(state, problem):
     # cost : 60
     # time : 42.6
     ########################
-    heuristic = 0
-    for food in foodGrid.asList():
-        heuristic = max(heuristic, mazeDistance(position, food, problem.startingGameState))
+    # heuristic = 0
+    # for food in foodGrid.asList():
+    #     heuristic = max(heuristic, mazeDistance(position, food, problem.startingGameState))
 
-    return heuristic
+    # 6 Min Pacman-Food Maze Distance plus Maze Distance MST of the Food
+    # expanded nodes : 255
+    # cost : 60
+    # time : 0.1s
+    ########################
+    # Pacman has to reach some food, and then to join up all the rest, which
+    # takes at least a spanning tree of it.  Eating a food can lower the tree
+    # by no more than the distance to the nearest other food, so this is
+    # consistent as well as admissible.
+    info = getFoodHeuristicInfo(problem)
+    remaining = []
+    mask = 0
+    for i, (foodX, foodY) in enumerate(info['foodList']):
+        if foodGrid[foodX][foodY]:
+            remaining.append(i)
+            mask |= 1 << i
+    if len(remaining) == 0:
+        return 0
+    distances = info['mazeDistances'].getRow(position)
+    height = problem.walls.height
+    foodList = info['foodList']
+    heuristic = min([distances[foodList[i][0] * height + foodList[i][1]] for i in remaining])
+    return heuristic + getFoodSpanningTree(info, mask, remaining)
+
+
+def getFoodHeuristicInfo(problem):
+    """
+    Fills in problem.heuristicInfo, once per problem, with what foodHeuristic
+    needs: the start state's food as a list ('foodList', whose order gives
+    each food its bit in a food bitmask), the maze distance between every
+    pair of those foods ('foodDistances'), the maze distance table of the
+    layout ('mazeDistances') and the spanning tree weights found so far,
+    keyed by food bitmask ('spanningTrees').
+    """
+    info = problem.heuristicInfo
+    if 'foodList' not in info:
+        mazeDistances = problem.startingGameState.data.layout.getMazeDistances()
+        if isinstance(problem, PackedFoodSearchProblem):
+            foodList = problem.targets
+        else:
+            foodList = problem.getStartState()[1].asList()
+        info['foodList'] = foodList
+        info['foodDistances'] = [mazeDistances.getDistances(food, foodList) for food in foodList]
+        info['mazeDistances'] = mazeDistances
+        info['spanningTrees'] = {}
+    return info
+
+
+def getFoodSpanningTree(info, mask, remaining):
+    """
+    The weight of a minimum spanning tree, in maze distance, of the foods
+    numbered in remaining (whose bitmask is mask).  Prim's algorithm, run at
+    most once per set of foods.
+    """
+    spanningTrees = info['spanningTrees']
+    if mask not in spanningTrees:
+        foodDistances = info['foodDistances']
+        first = foodDistances[remaining[0]]
+        closest = dict([(i, first[i]) for i in remaining[1:]])
+        weight = 0
+        while len(closest) > 0:
+            nearest = min(closest, key=closest.get)
+            weight += closest.pop(nearest)
+            row = foodDistances[nearest]
+            for i in closest:
+                if row[i] < closest[i]:
+                    closest[i] = row[i]
+        spanningTrees[mask] = weight
+    return spanningTrees[mask]
+
+
+class PackedFoodSearchProblem:
+    """
+    The FoodSearchProblem with compact states.  A search state is a pair of
+    ints ( cell, foodMask ) where
+
+      cell:     Pacman's position as the cell number x * height + y
+      foodMask: bit i is set while targets[i] is still to be eaten
+
+    so states hash and compare in constant time and take a few dozen bytes,
+    instead of copying and hashing a whole food Grid.  The moves out of every
+    cell are taken from the layout's MoveTable, by cell number, when the
+    problem is made.  targets defaults to the food of startingGameState;
+    getPosition and unpackState convert back.
+    """
+
+    def __init__(self, startingGameState, targets=None):
+        self.walls = startingGameState.getWalls()
+        self.startingGameState = startingGameState
+        self.height = self.walls.height
+        if targets == None:
+            targets = startingGameState.getFood().asList()
+        self.targets = list(targets)
+        self.targetCells = [self.getCell(target) for target in self.targets]
+        self.targetBits = [0] * (self.walls.width * self.height)
+        for i, cell in enumerate(self.targetCells):
+            self.targetBits[cell] |= 1 << i
+        # The layout's compiled moves (see game.MoveTable), by cell number
+        moveTable = getattr(self.walls, 'moveTable', None)
+        if moveTable == None:
+            moveTable = MoveTable(self.walls)
+        self.successors = []
+        for cell, moves in enumerate(moveTable.successors):
+            x, y = self.getPosition(cell)
+            if self.walls[x][y]:
+                moves = ()
+            self.successors.append(tuple([(self.getCell(nextPosition), direction)
+                                          for nextPosition, direction in moves]))
+        startCell = self.getCell(startingGameState.getPacmanPosition())
+        self.start = (startCell, ((1 << len(self.targets)) - 1) & ~self.targetBits[startCell])
+        self._expanded = 0  # DO NOT CHANGE
+        self.heuristicInfo = {}  # A dictionary for the heuristic to store information
+
+    def getCell(self, position):
+        x, y = position
+        return int(x) * self.height + int(y)
+
+    def getPosition(self, cell):
+        return divmod(cell, self.height)
+
+    def unpackState(self, state):
+        "Returns the ( pacmanPosition, foodGrid ) FoodSearchProblem state"
+        cell, foodMask = state
+        foodGrid = Grid(self.walls.width, self.height)
+        for i, (x, y) in enumerate(self.targets):
+            foodGrid[x][y] = foodMask >> i & 1 == 1
+        return self.getPosition(cell), foodGrid
+
+    def getStartState(self):
+        return self.start
+
+    def isGoalState(self, state):
+        return state[1] == 0
+
+    def getSuccessors(self, state):
+        "Returns successor states, the actions they require, and a cost of 1."
+        cell, foodMask = state
+        self._expanded += 1  # DO NOT CHANGE
+        targetBits = self.targetBits
+        return [((nextCell, foodMask & ~targetBits[nextCell]), direction, 1)
+                for nextCell, direction in self.successors[cell]]
+
+    def getCostOfActions(self, actions):
+        """Returns the cost of a particular sequence of actions.  If those actions
+        include an illegal move, return 999999"""
+        x, y = self.getPosition(self.getStartState()[0])
+        cost = 0
+        for action in actions:
+            # figure out the next state and see whether it's legal
+            dx, dy = Actions.directionToVector(action)
+            x, y = int(x + dx), int(y + dy)
+            if self.walls[x][y]:
+                return 999999
+            cost += 1
+        return cost
+
+
+class PackedCornersProblem(PackedFoodSearchProblem):
+    """
+    The CornersProblem with the compact states of PackedFoodSearchProblem:
+    the four corners are the targets, whatever food there is.
+    """
+
+    def __init__(self, startingGameState):
+        walls = startingGameState.getWalls()
+        top, right = walls.height - 2, walls.width - 2
+        self.corners = ((1, 1), (1, top), (right, 1), (right, top))
+        for corner in self.corners:
+            if not startingGameState.hasFood(*corner):
+                print('Warning: no food in corner ' + str(corner))
+        PackedFoodSearchProblem.__init__(self, startingGameState, self.corners)
+
+
+def packedFoodHeuristic(state, problem):
+    """
+    foodHeuristic for a PackedFoodSearchProblem (or PackedCornersProblem):
+    the maze distance to the nearest target left plus the weight of a
+    minimum spanning tree of the targets left.
+    """
+    cell, foodMask = state
+    if foodMask == 0:
+        return 0
+    info = getFoodHeuristicInfo(problem)
+    remaining = []
+    mask = foodMask
+    while mask:
+        bit = mask & -mask
+        remaining.append(bit.bit_length() - 1)
+        mask ^= bit
+    distances = info['mazeDistances'].getRow(problem.getPosition(cell))
+    targetCells = problem.targetCells
+    heuristic = min([distances[targetCells[i]] for i in remaining])
+    return heuristic + getFoodSpanningTree(info, foodMask, remaining)
+
+
+class AStarPackedFoodSearchAgent(SearchAgent):
+    "A SearchAgent for PackedFoodSearchProblem using A* and packedFoodHeuristic"
+
+    def __init__(self):
+        self.searchFunction = lambda prob: search.aStarSearch(prob, packedFoodHeuristic)
+        self.searchType = PackedFoodSearchProblem
+
+
+class AStarPackedCornersAgent(SearchAgent):
+    "A SearchAgent for PackedCornersProblem using A* and packedFoodHeuristic"
+
+    def __init__(self):
+        self.searchFunction = lambda prob: search.aStarSearch(prob, packedFoodHeuristic)
+        self.searchType = PackedCornersProblem
 
 
 class ClosestDotSearchAgent(SearchAgent):
@@ -634,12 +869,17 @@ class AnyFoodSearchProblem(PositionSearchProblem):
 
 def mazeDistance(point1, point2, gameState):
     """
-    Returns the maze distance between any two points, using the search functions
-    you have already built. The gameState can be any game state -- Pacman's
-    position in that state is ignored.
+    Returns the maze distance between any two points. The gameState can be any
+    game state -- Pacman's position in that state is ignored.
 
     Example usage: mazeDistance( (2,4), (5,6), gameState)
 
+    The distances are looked up in the layout's table of maze distances (see
+    layout.MazeDistances), which is computed once per maze, so each call
+    takes constant time.  As with the breadth-first search this used to run,
+    points with no path between them are 0 apart (the length of the empty
+    plan bfs returns).
+
     This might be a useful helper function for your ApproximateSearchAgent.
     """
     x1, y1 = point1
@@ -647,5 +887,8 @@ def mazeDistance(point1, point2, gameState):
     walls = gameState.getWalls()
     assert not walls[x1][y1], 'point1 is a wall: ' + str(point1)
     assert not walls[x2][y2], 'point2 is a wall: ' + str(point2)
-    prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
-    return len(search.bfs(prob))
+    mazeDistances = gameState.data.layout.getMazeDistances()
+    distance = mazeDistances.getDistance(point1, point2)
+    if distance == mazeDistances.UNREACHABLE:
+        return 0
+    return distance
@@ -0,0 +1,235 @@
+# benchmark.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Micro-benchmarks for the game engine and the adversarial search agents:
+
+  python benchmark.py              # run, and compare with benchmarkBaseline.json
+  python benchmark.py --save       # run, and store the results as the baseline
+  python benchmark.py -b AlphaBeta # only the benchmarks with 'AlphaBeta' in their name
+
+Each benchmark reports operations per second (the best of a few timed runs)
+and the bytes allocated per operation (the tracemalloc peak while a single
+operation runs).  A benchmark more than --tolerance slower than its baseline,
+or allocating that much more, is a regression, and the script exits with
+status 1.  Timings depend on the machine, so compare against a baseline saved
+on the same machine.
+
+Every benchmark works on states sampled from a game played with a fixed seed,
+so runs are comparable.
+"""
+
+import itertools
+import json
+import random
+import sys
+import timeit
+import tracemalloc
+
+import layout
+import multiAgents
+import pacman
+
+SEED = 188
+NUM_STATES = 50
+TIMING_RUNS = 5
+ALLOCATION_CALLS = 20
+ALLOCATION_SLACK = 256
+DEFAULT_BASELINE = 'benchmarkBaseline.json'
+
+ENGINE_LAYOUTS = [('mediumClassic', 2), ('smallClassic', 2)]
+AGENT_LAYOUT = 'mediumClassic'
+AGENT_DEPTHS = [2, 3, 4]
+
+
+def sampleStates(layoutName, numGhosts=0, numStates=NUM_STATES):
+    """
+    Returns numStates (state, agentIndex, action) triples met while playing
+    random legal moves from the start of layoutName, starting over whenever
+    a game ends.
+    """
+    random.seed(SEED)
+    start = pacman.GameState()
+    start.initialize(layout.getLayout(layoutName), numGhosts)
+    samples = []
+    state = start
+    agentIndex = 0
+    while len(samples) < numStates:
+        if state.isWin() or state.isLose():
+            state, agentIndex = start, 0
+        action = random.choice(state.getLegalActions(agentIndex))
+        samples.append((state, agentIndex, action))
+        state = state.generateSuccessor(agentIndex, action)
+        agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return samples
+
+
+def cycling(function, argumentList):
+    "An operation calling function on each of argumentList in turn"
+    arguments = itertools.cycle(argumentList)
+    return lambda: function(*next(arguments))
+
+
+def engineBenchmarks(layoutName, numGhosts=0):
+    samples = sampleStates(layoutName, numGhosts)
+    states = [(state,) for state, agentIndex, action in samples]
+    food = layout.getLayout(layoutName).food
+    return [
+        ('generateSuccessor/' + layoutName,
+         cycling(lambda state, agentIndex, action: state.generateSuccessor(agentIndex, action), samples)),
+        ('getLegalActions/' + layoutName,
+         cycling(lambda state, agentIndex, action: state.getLegalActions(agentIndex), samples)),
+        ('deepCopy/' + layoutName, cycling(lambda state: state.deepCopy(), states)),
+        ('hash/' + layoutName, cycling(hash, states)),
+        ('Grid.copy/' + layoutName, food.copy),
+        ('Grid.count/' + layoutName, food.count),
+        ('Grid.asList/' + layoutName, food.asList),
+    ]
+
+
+def agentBenchmarks(layoutName=AGENT_LAYOUT, depths=AGENT_DEPTHS):
+    """
+    Times getAction from the states of the sample game where it is Pacman's
+    turn.
+    """
+    samples = sampleStates(layoutName, 2)
+    states = [(state,) for state, agentIndex, action in samples
+              if agentIndex == 0 and not state.isWin() and not state.isLose()]
+    benchmarks = []
+    for agentType in [multiAgents.MinimaxAgent, multiAgents.AlphaBetaAgent]:
+        for depth in depths:
+            agent = agentType(depth=str(depth))
+            benchmarks.append(('%s/depth%d/%s' % (agentType.__name__, depth, layoutName),
+                               cycling(agent.getAction, states)))
+    return benchmarks
+
+
+def allBenchmarks():
+    benchmarks = []
+    for layoutName, numGhosts in ENGINE_LAYOUTS:
+        benchmarks.extend(engineBenchmarks(layoutName, numGhosts))
+    benchmarks.extend(agentBenchmarks())
+    return benchmarks
+
+
+def timeOperation(operation, runs=TIMING_RUNS):
+    """
+    Returns (the best operations per second over runs timed runs, the number
+    of operations in a run).
+    """
+    timer = timeit.Timer(operation)
+    best = 0
+    for run in range(runs):
+        number, elapsed = timer.autorange()
+        best = max(best, number / elapsed)
+    return best, number
+
+
+def measureAllocations(operation, calls=ALLOCATION_CALLS):
+    "Returns the mean tracemalloc peak, in bytes, of calls single operations"
+    total = 0
+    tracemalloc.start()
+    try:
+        for call in range(calls):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            operation()
+            total += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return total // calls
+
+
+def runBenchmarks(benchmarks, baseline={}):
+    results = {}
+    for name, operation in benchmarks:
+        opsPerSec, number = timeOperation(operation)
+        bytesPerOp = measureAllocations(operation, min(number, ALLOCATION_CALLS))
+        results[name] = {'opsPerSec': opsPerSec, 'bytesPerOp': bytesPerOp}
+        change = ''
+        if name in baseline:
+            change = '%+6.1f%%' % (100.0 * (opsPerSec / baseline[name]['opsPerSec'] - 1))
+        print('%-45s %14.1f ops/sec %10d bytes/op %s' % (name, opsPerSec, bytesPerOp, change))
+        sys.stdout.flush()
+    return results
+
+
+def findRegressions(results, baseline, tolerance):
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if result['opsPerSec'] < old['opsPerSec'] * (1 - tolerance):
+            regressions.append('%s: %.1f ops/sec, baseline %.1f' %
+                               (name, result['opsPerSec'], old['opsPerSec']))
+        if result['bytesPerOp'] > old['bytesPerOp'] * (1 + tolerance) + ALLOCATION_SLACK:
+            regressions.append('%s: %d bytes/op, baseline %d' %
+                               (name, result['bytesPerOp'], old['bytesPerOp']))
+    return regressions
+
+
+def readBaseline(filename):
+    try:
+        f = open(filename)
+    except IOError:
+        return {}
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+def writeBaseline(filename, results):
+    f = open(filename, 'w')
+    try:
+        json.dump(results, f, indent=1, sort_keys=True)
+        f.write('\n')
+    finally:
+        f.close()
+
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser(usage='python benchmark.py <options>')
+    parser.add_option('-b', '--benchmark', dest='pattern', default='',
+                      help='Only run the benchmarks whose name contains this')
+    parser.add_option('--baseline', dest='baseline', default=DEFAULT_BASELINE,
+                      help='The baseline results file [Default: %default]')
+    parser.add_option('--save', action='store_true', dest='save', default=False,
+                      help='Store the results in the baseline file instead of comparing')
+    parser.add_option('--tolerance', dest='tolerance', type='float', default=0.25,
+                      help='The fraction slower (or bigger) that counts as a regression [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    baseline = readBaseline(options.baseline)
+    benchmarks = [(name, operation) for name, operation in allBenchmarks()
+                  if options.pattern in name]
+    results = runBenchmarks(benchmarks, baseline)
+    if options.save:
+        baseline.update(results)
+        writeBaseline(options.baseline, baseline)
+        print('Saved %d results to %s' % (len(results), options.baseline))
+    else:
+        regressions = findRegressions(results, baseline, options.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if len(regressions) > 0:
+            sys.exit(1)
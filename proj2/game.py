@@ -25,6 +25,8 @@ import time
 import os
 import traceback
 import sys
+import random
+import math
 
 #######################
 # Parts worth reading #
@@ -37,7 +39,12 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+
+    Every move, Game hands the agent its own deep copy of the state, unless
+    the agent sets mutatesObservations to False, promising only to read the
+    states it is given (generating successors is fine; editing them is not).
     """
+    mutatesObservations = True
 
     def __init__(self, index=0):
         self.index = index
@@ -205,6 +212,8 @@ class Grid:
     def __eq__(self, other):
         if other == None:
             return False
+        if isinstance(other, BitGrid):
+            return other == self
         return self.data == other.data
 
     def __hash__(self):
@@ -247,22 +256,21 @@ class Grid:
         Returns an efficient int list representation
 
         (width, height, bitPackedInts...)
+
+        Cell i (counting up each column in turn) is bit CELLS_PER_INT - 1 -
+        i % CELLS_PER_INT of int i // CELLS_PER_INT.
         """
+        cells = ''.join(['1' if value else '0' for column in self.data for value in column])
+        size = self.CELLS_PER_INT
         bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
+        for start in range(0, len(cells), size):
+            bits.append(int(cells[start:start + size].ljust(size, '0'), 2))
+        if len(cells) % size == 0:
+            bits.append(0)
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -270,27 +278,12 @@ class Grid:
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
-        for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height:
-                    break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
-
-    def _unpackInt(self, packed, size):
-        bools = []
-        if packed < 0:
+        if min(bits) < 0:
             raise ValueError("must be a positive integer")
-        for i in range(size):
-            n = 2 ** (self.CELLS_PER_INT - i - 1)
-            if packed >= n:
-                bools.append(True)
-                packed -= n
-            else:
-                bools.append(False)
-        return bools
+        cells = ''.join([format(packed, '0%db' % self.CELLS_PER_INT) for packed in bits])
+        for x in range(self.width):
+            column = cells[x * self.height:(x + 1) * self.height]
+            self.data[x] = [cell == '1' for cell in column]
 
 
 def reconstituteGrid(bitRep):
@@ -299,6 +292,151 @@ def reconstituteGrid(bitRep):
     width, height = bitRep[:2]
     return Grid(width, height, bitRepresentation=bitRep[2:])
 
+
+class BitGrid:
+    """
+    A boolean Grid packed into a single Python int (a bitboard).  It offers the
+    same grid[x][y], count(), asList() and copy() interface as Grid.
+
+    Cell (x,y) is stored in bit x * height + y, the same ordering Grid.__hash__
+    uses, so a BitGrid and a Grid holding the same cells hash alike.  Python
+    ints are immutable, so copies simply share the int: copy() is O(1) and a
+    write rebinds self.bits without touching any other copy.  This makes it
+    cheap for successor states to share food with their parent.
+    """
+
+    def __init__(self, width, height, initialValue=False, bits=0):
+        if initialValue not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+        self.width = width
+        self.height = height
+        if initialValue:
+            bits = (1 << (width * height)) - 1
+        self.bits = bits
+
+    def fromGrid(grid):
+        """
+        Builds a BitGrid holding the same cells as a list-backed Grid.
+        """
+        bits = 0
+        base = 1
+        for column in grid.data:
+            for cell in column:
+                if cell:
+                    bits |= base
+                base <<= 1
+        return BitGrid(grid.width, grid.height, bits=bits)
+    fromGrid = staticmethod(fromGrid)
+
+    def toGrid(self):
+        g = Grid(self.width, self.height)
+        for x, y in self.asList():
+            g.data[x][y] = True
+        return g
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.width
+        if x < 0 or x >= self.width:
+            raise IndexError('BitGrid column out of range')
+        return _BitGridColumn(self, x)
+
+    def __setitem__(self, x, column):
+        for y, value in enumerate(column):
+            self._set(x * self.height + y, value)
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield _BitGridColumn(self, x)
+
+    def __len__(self):
+        return self.width
+
+    def _set(self, index, value):
+        if value:
+            self.bits |= 1 << index
+        else:
+            self.bits &= ~(1 << index)
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)]
+               for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None:
+            return False
+        if isinstance(other, Grid):
+            other = BitGrid.fromGrid(other)
+        return self.width == other.width and self.height == other.height and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def copy(self):
+        return BitGrid(self.width, self.height, bits=self.bits)
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item=True):
+        ones = bin(self.bits).count('1')
+        if item:
+            return ones
+        return self.width * self.height - ones
+
+    def asList(self, key=True):
+        bits = self.bits
+        if not key:
+            bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        list = []
+        height = self.height
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            list.append((index // height, index % height))
+            bits ^= low
+        return list
+
+    def packBits(self):
+        return self.toGrid().packBits()
+
+
+class _BitGridColumn:
+    """
+    The grid[x] view of a BitGrid, so that grid[x][y] reads and writes work.
+    """
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def __getitem__(self, y):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if y < 0 or y >= height:
+            raise IndexError('BitGrid row out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0:
+            y += self.grid.height
+        self.grid._set(self.offset + y, value)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        bits = self.grid.bits >> self.offset
+        for y in range(self.grid.height):
+            yield (bits >> y) & 1 == 1
+
 ####################################
 # Parts you shouldn't have to read #
 ####################################
@@ -358,6 +496,10 @@ class Actions:
         if (abs(x - x_int) + abs(y - y_int) > Actions.TOLERANCE):
             return [config.getDirection()]
 
+        moveTable = getattr(walls, 'moveTable', None)
+        if moveTable != None:
+            return list(moveTable.actions[x_int * walls.height + y_int])
+
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
             next_y = y_int + dy
@@ -372,6 +514,9 @@ class Actions:
     def getLegalNeighbors(position, walls):
         x, y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
+        moveTable = getattr(walls, 'moveTable', None)
+        if moveTable != None and 0 <= x_int < walls.width and 0 <= y_int < walls.height:
+            return list(moveTable.neighbors[x_int * walls.height + y_int])
         neighbors = []
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
@@ -393,19 +538,106 @@ class Actions:
     getSuccessor = staticmethod(getSuccessor)
 
 
+class MoveTable:
+    """
+    The legal moves on a fixed wall Grid, compiled once.  Every table is a list
+    indexed by cell id x * height + y:
+
+      actions[cell]    the directions Actions.getPossibleActions allows
+      neighbors[cell]  the cells Actions.getLegalNeighbors returns
+      successors[cell] (nextPosition, direction) pairs for the four compass
+                       moves, in the North, South, East, West order search
+                       problems expand in
+      forward[cell]    direction of travel -> the moves of an agent that can
+                       neither stop nor turn around unless at a dead end
+
+    A Layout compiles its walls into walls.moveTable, after which the Actions
+    helpers read from the table instead of probing the walls.  The walls must
+    not change afterwards.
+    """
+
+    def __init__(self, walls):
+        width, height = walls.width, walls.height
+        self.width = width
+        self.height = height
+        self.actions = []
+        self.neighbors = []
+        self.successors = []
+        self.forward = []
+        compass = [Directions.NORTH, Directions.SOUTH,
+                   Directions.EAST, Directions.WEST]
+
+        def isOpen(x, y):
+            return 0 <= x < width and 0 <= y < height and not walls[x][y]
+
+        for x in range(width):
+            for y in range(height):
+                moves = [(dir, (x + dx, y + dy)) for dir, (dx, dy) in Actions._directionsAsList
+                         if isOpen(x + dx, y + dy)]
+                actions = tuple([dir for dir, next in moves])
+                self.actions.append(actions)
+                self.neighbors.append(tuple([next for dir, next in moves]))
+                nextByDirection = dict(moves)
+                self.successors.append(tuple([(nextByDirection[dir], dir)
+                                              for dir in compass if dir in nextByDirection]))
+                forward = {}
+                turns = [dir for dir in actions if dir != Directions.STOP]
+                for heading in Actions._directions:
+                    reverse = Directions.REVERSE[heading]
+                    if reverse in turns and len(turns) > 1:
+                        forward[heading] = tuple([dir for dir in turns if dir != reverse])
+                    else:
+                        forward[heading] = tuple(turns)
+                self.forward.append(forward)
+
+
+class ZobristTable:
+    """
+    Random 64-bit keys for the independent pieces of a game state: each
+    agent's placement, each agent's scared timer, and every food and capsule
+    cell.  A state's Zobrist key is the XOR of the keys of its pieces, so a
+    successor's key is its parent's with the changed pieces XORed out and in.
+
+    Keys are drawn lazily from a fixed seed the first time a piece is seen.
+    """
+
+    def __init__(self, seed=188):
+        self.random = random.Random(seed)
+        self.keys = {}
+
+    def key(self, piece):
+        k = self.keys.get(piece)
+        if k == None:
+            k = self.keys[piece] = self.random.getrandbits(64)
+        return k
+
+
+ZOBRIST_TABLE = ZobristTable()
+
+
 class GameStateData:
 
     def __init__(self, prevState=None):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        The copy is copy-on-write: the food grid, the capsule list and every
+        agent state are shared with the predecessor.  Code that changes the
+        new packet must replace those objects rather than edit them, using
+        mutableAgentState for agent states.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates(prevState.agentStates)
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._zobrist = prevState._zobrist
+        else:
+            self._zobrist = None
+        # Bitmask of the agent states this packet owns and may edit in place
+        self._ownedAgents = 0
 
         self._foodEaten = None
         self._foodAdded = None
@@ -418,6 +650,9 @@ class GameStateData:
     def deepCopy(self):
         state = GameStateData(self)
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates(self.agentStates)
+        state._ownedAgents = -1
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
@@ -431,6 +666,16 @@ class GameStateData:
             copiedStates.append(agentState.copy())
         return copiedStates
 
+    def mutableAgentState(self, agentIndex):
+        """
+        Returns the state of the given agent for editing, first replacing it
+        with a private copy if it is still shared with the predecessor.
+        """
+        if not self._ownedAgents & (1 << agentIndex):
+            self.agentStates[agentIndex] = self.agentStates[agentIndex].copy()
+            self._ownedAgents |= 1 << agentIndex
+        return self.agentStates[agentIndex]
+
     def __eq__(self, other):
         """
         Allows two states to be compared.
@@ -438,6 +683,8 @@ class GameStateData:
         if other == None:
             return False
         # TODO Check for type of other
+        if self._zobrist != None and other._zobrist != None and self._zobrist != other._zobrist:
+            return False
         if not self.agentStates == other.agentStates:
             return False
         if not self.food == other.food:
@@ -452,13 +699,56 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate(self.agentStates):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                # hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113 * hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575)
+        if self._zobrist == None:
+            self._zobrist = self.computeZobristKey()
+        return self._zobrist ^ hash(self.score)
+
+    def agentZobristKey(agentIndex, agentState):
+        conf = agentState.configuration
+        if conf == None:
+            placement = ('agent', agentIndex, None, None)
+        else:
+            placement = ('agent', agentIndex, conf.pos, conf.direction)
+        return ZOBRIST_TABLE.key(placement) ^ ZOBRIST_TABLE.key(('scared', agentIndex, agentState.scaredTimer))
+    agentZobristKey = staticmethod(agentZobristKey)
+
+    def computeZobristKey(self):
+        """
+        Computes the Zobrist key of this state from scratch.
+        """
+        key = 0
+        for index, agentState in enumerate(self.agentStates):
+            key ^= GameStateData.agentZobristKey(index, agentState)
+        for x, y in self.food.asList():
+            key ^= ZOBRIST_TABLE.key(('food', x, y))
+        for x, y in self.capsules:
+            key ^= ZOBRIST_TABLE.key(('capsule', x, y))
+        return key
+
+    def updateZobristKey(self, prevAgentStates):
+        """
+        Brings the Zobrist key inherited from the predecessor, whose agent
+        states were prevAgentStates, up to date by XORing
+        out the pieces that changed in this successor and XORing in their new
+        values.  Only the agent states that were replaced or whose scared timer
+        changed, the food eaten or added and the capsule eaten are touched.
+        """
+        if self._zobrist == None:
+            return
+        key = self._zobrist
+        for index, agentState in enumerate(self.agentStates):
+            prevAgentState = prevAgentStates[index]
+            if agentState.configuration is not prevAgentState.configuration or \
+                    agentState.scaredTimer != prevAgentState.scaredTimer:
+                key ^= GameStateData.agentZobristKey(index, prevAgentState) ^ \
+                    GameStateData.agentZobristKey(index, agentState)
+        for cell in (self._foodEaten, self._foodAdded):
+            if cell != None:
+                key ^= ZOBRIST_TABLE.key(('food', cell[0], cell[1]))
+        if self._capsuleEaten != None:
+            x, y = self._capsuleEaten
+            key ^= ZOBRIST_TABLE.key(('capsule', x, y))
+        self._zobrist = key
 
     def __str__(self):
         width, height = self.layout.width, self.layout.height
@@ -518,12 +808,13 @@ class GameStateData:
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.food = layout.food.copy()
+        self.food = BitGrid.fromGrid(layout.food)
         #self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
+        self._zobrist = None
 
         self.agentStates = []
         numGhosts = 0
@@ -536,6 +827,7 @@ class GameStateData:
             self.agentStates.append(AgentState(
                 Configuration(pos, Directions.STOP), isPacman))
         self._eaten = [False for a in self.agentStates]
+        self._ownedAgents = -1
 
 
 try:
@@ -545,6 +837,189 @@ except:
     _BOINC_ENABLED = False
 
 
+class TimingHistogram:
+    """
+    Running count, total and max of a stream of non-negative numbers, with a
+    histogram of them in fixed buckets from which percentiles are estimated.
+    Its size does not grow with the number of values added.
+
+    Bucket 0 holds zeros.  Bucket b > 0 holds values up to
+    SMALLEST * 2 ** (b / BUCKETS_PER_DOUBLING), so a percentile is reported
+    as the upper edge of its bucket (never above max), within about 9% of
+    the exact value for anything larger than SMALLEST.
+    """
+    SMALLEST = 1e-6
+    BUCKETS_PER_DOUBLING = 8
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        bucket = self.bucketOf(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def bucketOf(self, value):
+        if value <= 0:
+            return 0
+        if value <= self.SMALLEST:
+            return 1
+        return 1 + int(math.log2(value / self.SMALLEST) * self.BUCKETS_PER_DOUBLING)
+
+    def upperEdge(self, bucket):
+        if bucket == 0:
+            return 0
+        return self.SMALLEST * 2 ** (float(bucket) / self.BUCKETS_PER_DOUBLING)
+
+    def percentile(self, p):
+        "Nearest-rank percentile p (0 < p <= 1) of a non-empty histogram"
+        rank = max(1, int(math.ceil(p * self.count)))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.upperEdge(bucket), self.max)
+        return self.max
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+
+class CountHistogram(TimingHistogram):
+    """
+    A TimingHistogram of whole numbers, such as successor counts, with one
+    bucket per distinct value so that its percentiles are exact.
+
+    >>> histogram = CountHistogram()
+    >>> for count in [3, 0, 12, 3, 7, 3, 250, 12, 3, 5]:
+    ...     histogram.add(count)
+    >>> histogram.count, histogram.total, histogram.max
+    (10, 298, 250)
+    >>> histogram.percentile(0.5), histogram.percentile(0.95)
+    (3, 250)
+    >>> other = CountHistogram()
+    >>> other.add(12)
+    >>> histogram.merge(other)
+    >>> histogram.percentile(0.6), histogram.percentile(0.8)
+    (7, 12)
+    """
+
+    def bucketOf(self, value):
+        return value
+
+    def upperEdge(self, bucket):
+        return bucket
+
+
+class GameTimings:
+    """
+    Per-agent, per-move timings gathered by Game.run.
+
+    For each agent it keeps a TimingHistogram of the seconds spent in the
+    calls to each of PHASES, and a CountHistogram of the number of
+    generateSuccessor calls the agent made while choosing each move.
+    summary() reduces these to count/total/p50/p95/max.
+    """
+    PHASES = ('registerInitialState', 'observationFunction', 'getAction')
+    SUCCESSORS = 'successorsPerMove'
+
+    def __init__(self, numAgents):
+        self.histograms = []
+        for i in range(numAgents):
+            histograms = dict([(measure, TimingHistogram()) for measure in self.PHASES])
+            histograms[self.SUCCESSORS] = CountHistogram()
+            self.histograms.append(histograms)
+
+    def record(self, agentIndex, measure, value):
+        self.histograms[agentIndex][measure].add(value)
+
+    def summary(self):
+        """
+        Returns a list of rows (agentIndex, measure, count, total, p50, p95, max),
+        skipping measures with no samples.
+        """
+        rows = []
+        for agentIndex, histograms in enumerate(self.histograms):
+            for measure in self.PHASES + (self.SUCCESSORS,):
+                histogram = histograms[measure]
+                if histogram.count > 0:
+                    rows.append((agentIndex, measure, histogram.count, histogram.total,
+                                 histogram.percentile(0.5), histogram.percentile(0.95), histogram.max))
+        return rows
+
+    def merge(self, other):
+        for histograms, otherHistograms in zip(self.histograms, other.histograms):
+            for measure, histogram in otherHistograms.items():
+                histograms[measure].merge(histogram)
+
+
+def exportTimings(games, filename):
+    """
+    Writes the timings of a list of games to filename, as CSV if its name ends
+    in .csv and as JSON otherwise.  Each game gets its own rows, followed by
+    rows for all the games together (game 'all').  Times are in seconds.
+    """
+    columns = ('game', 'agent', 'measure', 'count',
+               'total', 'p50', 'p95', 'max')
+    rows = []
+    combined = None
+    for gameIndex, game in enumerate(games):
+        rows.extend([(gameIndex,) + row for row in game.timings.summary()])
+        if combined == None:
+            combined = GameTimings(len(game.timings.histograms))
+        combined.merge(game.timings)
+    if combined != None:
+        rows.extend([('all',) + row for row in combined.summary()])
+
+    f = open(filename, 'w', newline='')
+    try:
+        if filename.endswith('.csv'):
+            import csv
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        else:
+            import json
+            json.dump([dict(zip(columns, row)) for row in rows], f, indent=1)
+    finally:
+        f.close()
+
+
+class AgentOutput:
+    """
+    Stands in for sys.stdout or sys.stderr while a game with muted agents
+    runs.  Text goes to the buffer of agentIndex, the agent currently
+    running, or to the original stream when no agent is.
+    """
+
+    def __init__(self, buffers, stream):
+        self.buffers = buffers
+        self.stream = stream
+        self.agentIndex = None
+
+    def write(self, text):
+        if self.agentIndex == None:
+            return self.stream.write(text)
+        return self.buffers[self.agentIndex].write(text)
+
+    def flush(self):
+        if self.agentIndex == None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
@@ -560,11 +1035,17 @@ class Game:
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
         self.moveHistory = []
+        # An optional gameRecord.GameRecordWriter that logs moves as they are made
+        self.recorder = None
+        self.timings = GameTimings(len(agents))
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
         import io
         self.agentOutput = [io.StringIO() for agent in agents]
+        # The AgentOutput streams standing in for stdout and stderr while
+        # a game with muted agents runs
+        self.mutedStreams = None
 
     def getProgress(self):
         if self.gameOver:
@@ -580,33 +1061,71 @@ class Game:
         self.agentCrashed = True
         self.rules.agentCrash(self, agentIndex)
 
-    OLD_STDOUT = None
-    OLD_STDERR = None
-
     def mute(self, agentIndex):
-        if not self.muteAgents:
+        "Sends what agentIndex prints to its agentOutput buffer"
+        if self.mutedStreams == None:
             return
-        global OLD_STDOUT, OLD_STDERR
-        import io
-        OLD_STDOUT = sys.stdout
-        OLD_STDERR = sys.stderr
-        sys.stdout = self.agentOutput[agentIndex]
-        sys.stderr = self.agentOutput[agentIndex]
+        for stream in self.mutedStreams:
+            stream.agentIndex = agentIndex
 
     def unmute(self):
-        if not self.muteAgents:
+        if self.mutedStreams == None:
             return
-        global OLD_STDOUT, OLD_STDERR
-        # Revert stdout/stderr to originals
-        sys.stdout = OLD_STDOUT
-        sys.stderr = OLD_STDERR
+        for stream in self.mutedStreams:
+            stream.agentIndex = None
+
+    def _startMuting(self):
+        self.mutedStreams = [AgentOutput(self.agentOutput, sys.stdout),
+                             AgentOutput(self.agentOutput, sys.stderr)]
+        sys.stdout, sys.stderr = self.mutedStreams
+
+    def _stopMuting(self):
+        if sys.stdout is self.mutedStreams[0]:
+            sys.stdout = self.mutedStreams[0].stream
+        if sys.stderr is self.mutedStreams[1]:
+            sys.stderr = self.mutedStreams[1].stream
+        self.mutedStreams = None
+
+    def _observe(self, agentIndex):
+        "The state to hand agentIndex: a copy, unless the agent only reads it"
+        if self.copyObservations[agentIndex]:
+            return self.state.deepCopy()
+        return self.state
+
+    def _agentMethods(self, name):
+        "Each agent's method called name, or None for agents without one"
+        return [getattr(agent, name, None) for agent in self.agents]
+
+    def _generatedSuccessors(self):
+        "The number of generateSuccessor calls so far, for states that count them"
+        return getattr(self.state.__class__, 'generatedSuccessors', 0)
 
     def run(self):
         """
         Main control loop for game play.
         """
+        # Agents' output is redirected once for the whole game; mute and
+        # unmute then only say whose buffer it goes to
+        if self.muteAgents:
+            self._startMuting()
+        try:
+            self._run()
+        finally:
+            if self.mutedStreams != None:
+                self._stopMuting()
+
+    def _run(self):
+        # What each agent implements, looked up once rather than every move
+        registerInitialState = self._agentMethods('registerInitialState')
+        observationFunction = self._agentMethods('observationFunction')
+        final = self._agentMethods('final')
+        self.copyObservations = [getattr(agent, 'mutatesObservations', True)
+                                 for agent in self.agents]
+
         self.display.initialize(self.state.data)
         self.numMoves = 0
+        if self.recorder != None:
+            self.recorder.start(self.state)
 
         # self.display.initialize(self.state.makeObservation(1).data)
         # inform learning agents of the game start
@@ -620,30 +1139,41 @@ class Game:
                 self.unmute()
                 self._agentCrash(i, quiet=True)
                 return
-            if ("registerInitialState" in dir(agent)):
+            if registerInitialState[i] != None:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
                         timed_func = TimeoutFunction(
-                            agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                            registerInitialState[i], self.rules.getMaxStartupTime(i))
                         try:
                             start_time = time.time()
                             timed_func(self.state.deepCopy())
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
-                        except TimeoutFunctionException:
+                            self.timings.record(
+                                i, 'registerInitialState', time_taken)
+                        except TimeoutFunctionException as e:
+                            if not timed_func.ownsTimeout(e):
+                                raise
                             print("Agent %d ran out of time on startup!" %
                                   i, file=sys.stderr)
                             self.unmute()
                             self.agentTimeout = True
                             self._agentCrash(i, quiet=True)
                             return
+                    except TimeoutFunctionException:
+                        # An enclosing deadline passed
+                        self.unmute()
+                        raise
                     except Exception as data:
                         self._agentCrash(i, quiet=False)
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    start_time = time.time()
+                    registerInitialState[i](self.state.deepCopy())
+                    self.timings.record(
+                        i, 'registerInitialState', time.time() - start_time)
                 # TODO: could this exceed the total time
                 self.unmute()
 
@@ -655,44 +1185,58 @@ class Game:
             agent = self.agents[agentIndex]
             move_time = 0
             skip_action = False
+            successors = self._generatedSuccessors()
             # Generate an observation of the state
-            if 'observationFunction' in dir(agent):
+            if observationFunction[agentIndex] != None:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(
-                            self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(
+                            observationFunction[agentIndex], self.rules.getMoveTimeout(agentIndex))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
-                        except TimeoutFunctionException:
+                            observation = timed_func(self._observe(agentIndex))
+                        except TimeoutFunctionException as e:
+                            if not timed_func.ownsTimeout(e):
+                                raise
                             skip_action = True
                         move_time += time.time() - start_time
+                        self.timings.record(
+                            agentIndex, 'observationFunction', move_time)
+                        self.unmute()
+                    except TimeoutFunctionException:
+                        # An enclosing deadline passed
                         self.unmute()
+                        raise
                     except Exception as data:
                         self._agentCrash(agentIndex, quiet=False)
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(
-                        self.state.deepCopy())
+                    start_time = time.time()
+                    observation = observationFunction[agentIndex](
+                        self._observe(agentIndex))
+                    self.timings.record(
+                        agentIndex, 'observationFunction', time.time() - start_time)
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self._observe(agentIndex)
 
             # Solicit an action
             action = None
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(
-                        self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(
+                        agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time)
                     try:
                         start_time = time.time()
                         if skip_action:
                             raise TimeoutFunctionException()
                         action = timed_func(observation)
-                    except TimeoutFunctionException:
+                    except TimeoutFunctionException as e:
+                        if not timed_func.ownsTimeout(e):
+                            raise
                         print("Agent %d timed out on a single move!" %
                               agentIndex, file=sys.stderr)
                         self.agentTimeout = True
@@ -700,7 +1244,9 @@ class Game:
                         self.unmute()
                         return
 
-                    move_time += time.time() - start_time
+                    action_time = time.time() - start_time
+                    move_time += action_time
+                    self.timings.record(agentIndex, 'getAction', action_time)
 
                     if move_time > self.rules.getMoveWarningTime(agentIndex):
                         self.totalAgentTimeWarnings[agentIndex] += 1
@@ -724,13 +1270,22 @@ class Game:
                         self.unmute()
                         return
                     self.unmute()
+                except TimeoutFunctionException:
+                    # An enclosing deadline passed
+                    self.unmute()
+                    raise
                 except Exception as data:
                     self._agentCrash(agentIndex)
                     self.unmute()
                     return
             else:
+                start_time = time.time()
                 action = agent.getAction(observation)
+                self.timings.record(
+                    agentIndex, 'getAction', time.time() - start_time)
             self.unmute()
+            self.timings.record(agentIndex, GameTimings.SUCCESSORS,
+                                self._generatedSuccessors() - successors)
 
             # Execute the action
             self.moveHistory.append((agentIndex, action))
@@ -745,6 +1300,8 @@ class Game:
                     return
             else:
                 self.state = self.state.generateSuccessor(agentIndex, action)
+            if self.recorder != None:
+                self.recorder.recordMove(agentIndex, action, self.state)
 
             # Change the display
             self.display.update(self.state.data)
@@ -764,10 +1321,10 @@ class Game:
 
         # inform a learning agent of the game result
         for agentIndex, agent in enumerate(self.agents):
-            if "final" in dir(agent):
+            if final[agentIndex] != None:
                 try:
                     self.mute(agentIndex)
-                    agent.final(self.state)
+                    final[agentIndex](self.state)
                     self.unmute()
                 except Exception as data:
                     if not self.catchExceptions:
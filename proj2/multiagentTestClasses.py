@@ -158,6 +158,19 @@ def run(lay, layName, pac, ghosts, disp, nGames=1, name='games'):
     return stats
 
 
+def runTrackingExplored(lay, layName, pac, ghosts, disp, nGames=1, name='games'):
+    """
+    Runs games like run, with the states the agents explore tracked (the
+    graders count them) and the previous tracking setting restored afterwards.
+    """
+    previous = (GameState.trackExplored, GameState.exploredLimit)
+    GameState.setExploredTracking()
+    try:
+        return run(lay, layName, pac, ghosts, disp, nGames, name)
+    finally:
+        GameState.setExploredTracking(*previous)
+
+
 class GradingAgent(Agent):
     def __init__(self, seed, studentAgent, optimalActions, altDepthActions, partialPlyBugActions):
         # save student agent and actions of refernce agents
@@ -345,7 +358,7 @@ class PacmanGameTreeTest(testClasses.TestCase):
                            altDepthActions, partialPlyBugActions)
         # check return codes and assign grades
         disp = self.question.getDisplay()
-        stats = run(lay, self.layout_name, pac, [DirectionalGhost(
+        stats = runTrackingExplored(lay, self.layout_name, pac, [DirectionalGhost(
             i + 1) for i in range(2)], disp, name=self.alg)
         if stats['timeouts'] > 0:
             self.addMessage('Agent timed out on smallClassic.  No credit')
@@ -395,7 +408,7 @@ class PacmanGameTreeTest(testClasses.TestCase):
             ourPacOptions = {}
         pac = PolyAgent(self.seed, multiAgents, ourPacOptions, self.depth)
         disp = self.question.getDisplay()
-        run(lay, self.layout_name, pac, [DirectionalGhost(
+        runTrackingExplored(lay, self.layout_name, pac, [DirectionalGhost(
             i + 1) for i in range(2)], disp, name=self.alg)
         (optimalActions, altDepthActions, partialPlyBugActions) = pac.getTraces()
         # recover traces and record to file
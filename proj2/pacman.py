@@ -43,6 +43,8 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
+from game import BitGrid
 from util import nearestPoint
 from util import manhattanDistance
 import util
@@ -52,6 +54,8 @@ import types
 import time
 import random
 import os
+import re
+import struct
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
@@ -77,15 +81,41 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
+    # Optional bookkeeping of the states generateSuccessor visits, which the
+    # graders use to count the states an agent explores.  It is off unless
+    # setExploredTracking turns it on, and then keeps at most exploredLimit
+    # distinct states (all of them if the limit is None) in explored, and the
+    # number of generateSuccessor calls in exploredCount.
+    trackExplored = False
+    exploredLimit = None
     explored = set()
+    exploredCount = 0
+
+    def setExploredTracking(enabled=True, limit=None):
+        GameState.trackExplored = enabled
+        GameState.exploredLimit = limit
+        GameState.getAndResetExplored()
+    setExploredTracking = staticmethod(setExploredTracking)
 
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
+        tmp = GameState.explored
         GameState.explored = set()
+        GameState.exploredCount = 0
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def recordExplored(parent, child):
+        GameState.exploredCount += 1
+        limit = GameState.exploredLimit
+        if limit == None or len(GameState.explored) < limit:
+            GameState.explored.add(parent)
+        if limit == None or len(GameState.explored) < limit:
+            GameState.explored.add(child)
+    recordExplored = staticmethod(recordExplored)
+
+    # static counter of generateSuccessor calls, read by Game.run's timings
+    generatedSuccessors = 0
+
     def getLegalActions(self, agentIndex=0):
         """
         Returns the legal actions for the agent specified.
@@ -109,29 +139,84 @@ class GameState:
 
         # Copy current state
         state = GameState(self)
+        state._applyRules(agentIndex, action, self.data.agentStates)
+        GameState.generatedSuccessors += 1
+        if GameState.trackExplored:
+            GameState.recordExplored(self, state)
+        return state
+
+    def applyMove(self, agentIndex, action):
+        """
+        Makes the specified agent take the action by changing this state in
+        place, and returns a token that undoMove uses to take the move back.
+
+        Unlike generateSuccessor this allocates no new state, which suits
+        depth-first searches that only ever need one path at a time:
+
+          token = state.applyMove(agentIndex, action)
+          value = search(state, ...)
+          state.undoMove(token)
 
+        Moves must be undone in the reverse order they were applied.  Since
+        the state keeps changing, it is not added to GameState.explored.
+        """
+        if self.isWin() or self.isLose():
+            raise Exception('Can\'t apply a move to a terminal state.')
+        data = self.data
+
+        # The rules replace, rather than edit, the food grid, the capsule
+        # list and any agent state they change, so the undo record only has
+        # to hold on to the old objects and scalars.
+        token = (tuple(data.agentStates), data.food, data.capsules, data._eaten,
+                 data.score, data.scoreChange, data._win, data._lose,
+                 data._foodEaten, data._foodAdded, data._capsuleEaten,
+                 data._agentMoved, data._zobrist, data._ownedAgents)
+
+        data._ownedAgents = 0
+        data._foodEaten = None
+        data._foodAdded = None
+        data._capsuleEaten = None
+        data.scoreChange = 0
+        self._applyRules(agentIndex, action, token[0])
+        return token
+
+    def undoMove(self, token):
+        """
+        Restores this state to what it was before the applyMove call that
+        returned token.
+        """
+        data = self.data
+        (agentStates, data.food, data.capsules, data._eaten,
+         data.score, data.scoreChange, data._win, data._lose,
+         data._foodEaten, data._foodAdded, data._capsuleEaten,
+         data._agentMoved, data._zobrist, data._ownedAgents) = token
+        data.agentStates[:] = agentStates
+
+    def _applyRules(self, agentIndex, action, prevAgentStates):
+        """
+        Updates this freshly copied state to reflect the agent's action.
+        """
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
-            state.data._eaten = [False for i in range(state.getNumAgents())]
-            PacmanRules.applyAction(state, action)
+            self.data._eaten = [False for i in range(self.getNumAgents())]
+            PacmanRules.applyAction(self, action)
         else:                # A ghost is moving
-            GhostRules.applyAction(state, action, agentIndex)
+            GhostRules.applyAction(self, action, agentIndex)
 
         # Time passes
         if agentIndex == 0:
-            state.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
+            self.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
         else:
-            GhostRules.decrementTimer(state.data.agentStates[agentIndex])
+            GhostRules.decrementTimer(
+                self.data.mutableAgentState(agentIndex))
 
         # Resolve multi-agent effects
-        GhostRules.checkDeath(state, agentIndex)
+        GhostRules.checkDeath(self, agentIndex)
 
         # Book keeping
-        state.data._agentMoved = agentIndex
-        state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
-        return state
+        self.data._agentMoved = agentIndex
+        self.data.score += self.data.scoreChange
+        self.data.updateZobristKey(prevAgentStates)
 
     def getLegalPacmanActions(self):
         return self.getLegalActions(0)
@@ -262,6 +347,102 @@ class GameState:
         """
         self.data.initialize(layout, numGhostAgents)
 
+    # The layout of toBytes: a header (number of agents), food and capsules as
+    # bitmasks over the cells (x * height + y), then each agent's position in
+    # half cells (NO_POSITION when it has none), direction and scared timer,
+    # and finally the score and the win/lose flags
+    _HEADER = struct.Struct('<B')
+    _AGENT = struct.Struct('<hhBH')
+    _TOTALS = struct.Struct('<iB')
+    _DIRECTIONS = [Directions.NORTH, Directions.SOUTH,
+                   Directions.EAST, Directions.WEST, Directions.STOP]
+    _DIRECTION_CODES = dict([(d, i) for i, d in enumerate(_DIRECTIONS)])
+    NO_POSITION = -32768
+
+    def toBytes(self):
+        """
+        Packs what changes during a game (food, capsules, agents, score and
+        outcome) into a few bytes, for sending states between processes or
+        storing them.  GameState.fromBytes rebuilds the state given the same
+        layout.
+        """
+        data = self.data
+        layout = data.layout
+        cellBytes = (layout.width * layout.height + 7) // 8
+        food = data.food
+        if not isinstance(food, BitGrid):
+            food = BitGrid.fromGrid(food)
+        capsules = 0
+        for x, y in data.capsules:
+            capsules |= 1 << (x * layout.height + y)
+        parts = [GameState._HEADER.pack(len(data.agentStates)),
+                 food.bits.to_bytes(cellBytes, 'little'),
+                 capsules.to_bytes(cellBytes, 'little')]
+        for agentState in data.agentStates:
+            conf = agentState.configuration
+            if conf == None:
+                x2 = y2 = GameState.NO_POSITION
+                direction = Directions.STOP
+            else:
+                x2, y2 = int(round(2 * conf.pos[0])), int(round(2 * conf.pos[1]))
+                direction = conf.direction
+            parts.append(GameState._AGENT.pack(x2, y2, GameState._DIRECTION_CODES[direction],
+                                               agentState.scaredTimer))
+        flags = int(data._win) | int(data._lose) << 1
+        parts.append(GameState._TOTALS.pack(int(data.score), flags))
+        return b''.join(parts)
+
+    def fromBytes(layout, packed):
+        """
+        Rebuilds a state packed by toBytes on the same layout.
+        """
+        numAgents = GameState._HEADER.unpack_from(packed)[0]
+        if len(packed) != GameState.packedSize(layout.width, layout.height, numAgents):
+            raise ValueError('Packed state does not match the layout')
+        state = GameState()
+        state.initialize(layout, numAgents - 1)
+        data = state.data
+        cellBytes = (layout.width * layout.height + 7) // 8
+        offset = GameState._HEADER.size
+        data.food = BitGrid(layout.width, layout.height,
+                            bits=int.from_bytes(packed[offset:offset + cellBytes], 'little'))
+        offset += cellBytes
+        capsules = int.from_bytes(packed[offset:offset + cellBytes], 'little')
+        data.capsules = [(x, y) for x, y in layout.capsules
+                         if capsules >> (x * layout.height + y) & 1]
+        offset += cellBytes
+        for agentState in data.agentStates:
+            x2, y2, direction, scaredTimer = GameState._AGENT.unpack_from(packed, offset)
+            offset += GameState._AGENT.size
+            if x2 == GameState.NO_POSITION:
+                agentState.configuration = None
+            else:
+                agentState.configuration = Configuration(
+                    (_fromHalfCells(x2), _fromHalfCells(y2)), GameState._DIRECTIONS[direction])
+            agentState.scaredTimer = scaredTimer
+        score, flags = GameState._TOTALS.unpack_from(packed, offset)
+        data.score = score
+        data._win = bool(flags & 1)
+        data._lose = bool(flags & 2)
+        return state
+    fromBytes = staticmethod(fromBytes)
+
+    def packedSize(width, height, numAgents):
+        """
+        The length of toBytes for a state with numAgents agents on a layout of
+        the given size.
+        """
+        cellBytes = (width * height + 7) // 8
+        return (GameState._HEADER.size + 2 * cellBytes +
+                numAgents * GameState._AGENT.size + GameState._TOTALS.size)
+    packedSize = staticmethod(packedSize)
+
+
+def _fromHalfCells(value):
+    if value % 2 == 0:
+        return value // 2
+    return value / 2.0
+
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
 #                                                                          #
@@ -348,7 +529,7 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions(state.getPacmanState().configuration, state.data.layout.walls)
+        return Actions.getPossibleActions(state.data.agentStates[0].configuration, state.data.layout.walls)
     getLegalActions = staticmethod(getLegalActions)
 
     def applyAction(state, action):
@@ -359,7 +540,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.mutableAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector(action, PacmanRules.PACMAN_SPEED)
@@ -389,11 +570,12 @@ class PacmanRules:
                 state.data._win = True
         # Eat capsule
         if(position in state.getCapsules()):
-            state.data.capsules.remove(position)
+            state.data.capsules = [
+                c for c in state.data.capsules if c != position]
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range(1, len(state.data.agentStates)):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.mutableAgentState(index).scaredTimer = SCARED_TIME
     consume = staticmethod(consume)
 
 
@@ -409,8 +591,12 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState(ghostIndex).configuration
-        possibleActions = Actions.getPossibleActions(
-            conf, state.data.layout.walls)
+        walls = state.data.layout.walls
+        moveTable = getattr(walls, 'moveTable', None)
+        if moveTable != None and conf.isInteger():
+            x, y = conf.pos
+            return list(moveTable.forward[int(x) * walls.height + int(y)][conf.direction])
+        possibleActions = Actions.getPossibleActions(conf, walls)
         reverse = Actions.reverseDirection(conf.direction)
         if Directions.STOP in possibleActions:
             possibleActions.remove(Directions.STOP)
@@ -425,7 +611,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.mutableAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0:
             speed /= 2.0
@@ -437,8 +623,11 @@ class GhostRules:
     def decrementTimer(ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint(
-                ghostState.configuration.pos)
+            # Replace rather than edit the configuration: it is shared with
+            # the parent state's copy of this agent.
+            conf = ghostState.configuration
+            ghostState.configuration = Configuration(
+                nearestPoint(conf.pos), conf.direction)
         ghostState.scaredTimer = max(0, timer - 1)
     decrementTimer = staticmethod(decrementTimer)
 
@@ -459,10 +648,12 @@ class GhostRules:
 
     def collide(state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
+            ghostState = state.data.mutableAgentState(agentIndex)
             state.data.scoreChange += 200
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -543,17 +734,27 @@ def readCommand(argv):
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file to replay', default=None)
+    parser.add_option('--replayFrom', dest='replayFrom', type='int',
+                      help=default('The move to start a replay from'), default=0)
     parser.add_option('-a', '--agentArgs', dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
                       help=default('How many episodes are training (suppresses output)'), default=0)
     parser.add_option('--frameTime', dest='frameTime', type='float',
                       help=default('Time to delay between frames; <0 means keyboard'), default=0.1)
+    parser.add_option('--maxFrameRate', dest='maxFrameRate', type='float',
+                      help='Draw on a separate thread at most this many frames a second (0 for no limit), skipping frames the display cannot keep up with', default=None)
     parser.add_option('-c', '--catchExceptions', action='store_true', dest='catchExceptions',
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes to play the games in parallel'), default=1)
+    parser.add_option('--seed', dest='seed', default=None,
+                      help='Master random seed; each game is seeded from it, so results do not depend on --workers')
+    parser.add_option('--timings', dest='timings', default=None,
+                      help='Writes per-agent move timings to this file (CSV if it ends in .csv, JSON otherwise)')
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -598,6 +799,10 @@ def readCommand(argv):
         import textDisplay
         textDisplay.SLEEP_TIME = options.frameTime
         args['display'] = textDisplay.PacmanGraphics()
+    elif options.maxFrameRate != None:
+        import graphicsDisplay
+        args['display'] = graphicsDisplay.ThreadedPacmanGraphics(
+            options.zoom, maxFrameRate=options.maxFrameRate)
     else:
         import graphicsDisplay
         args['display'] = graphicsDisplay.PacmanGraphics(
@@ -606,12 +811,23 @@ def readCommand(argv):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['workers'] = options.workers
+    args['seed'] = options.seed
+    args['timings'] = options.timings
+    if options.workers > 1 and options.seed == None:
+        args['seed'] = 'cs188' if options.fixRandomSeed else str(random.randrange(2 ** 32))
+        print('Using master random seed %s' % args['seed'])
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print('Replaying recorded game %s.' % options.gameToReplay)
+        import gameRecord
+        if gameRecord.isGameRecord(options.gameToReplay):
+            replayRecordedGame(options.gameToReplay,
+                               args['display'], options.replayFrom)
+            sys.exit(0)
         import pickle
-        f = open(options.gameToReplay)
+        f = open(options.gameToReplay, 'rb')
         try:
             recorded = pickle.load(f)
         finally:
@@ -623,6 +839,35 @@ def readCommand(argv):
     return args
 
 
+# Index of the names defined in the *gents.py files of each directory, keyed
+# by the directory and the files' modification times
+_AGENT_MODULE_INDEX = {}
+_DEFINITION = re.compile(r'^(?:class|def)\s+(\w+)', re.MULTILINE)
+
+
+def buildAgentIndex(moduleDir):
+    """
+    Maps each class or function defined at the top level of a *gents.py file
+    in moduleDir to the name of its module.  The files are read as text, not
+    imported, so looking an agent up imports only the module defining it.
+    """
+    moduleNames = sorted([f for f in os.listdir(moduleDir) if f.endswith('gents.py')])
+    key = (os.path.abspath(moduleDir),
+           tuple([(f, os.path.getmtime(os.path.join(moduleDir, f))) for f in moduleNames]))
+    if key not in _AGENT_MODULE_INDEX:
+        index = {}
+        for modulename in moduleNames:
+            f = open(os.path.join(moduleDir, modulename))
+            try:
+                source = f.read()
+            finally:
+                f.close()
+            for name in _DEFINITION.findall(source):
+                index.setdefault(name, modulename[:-3])
+        _AGENT_MODULE_INDEX[key] = index
+    return _AGENT_MODULE_INDEX[key]
+
+
 def loadAgent(pacman, nographics):
     # Looks through all pythonPath Directories for the right module,
     pythonPathStr = os.path.expandvars("$PYTHONPATH")
@@ -631,22 +876,28 @@ def loadAgent(pacman, nographics):
     else:
         pythonPathDirs = pythonPathStr.split(';')
     pythonPathDirs.append('.')
-
-    for moduleDir in pythonPathDirs:
-        if not os.path.isdir(moduleDir):
+    moduleDirs = [d for d in pythonPathDirs if os.path.isdir(d)]
+
+    # First the modules that define the agent, then (for agents that a module
+    # imports or assigns) every agent module
+    candidates = []
+    for moduleDir in moduleDirs:
+        moduleName = buildAgentIndex(moduleDir).get(pacman)
+        if moduleName != None:
+            candidates.append(moduleName)
+    for moduleDir in moduleDirs:
+        candidates.extend([f[:-3] for f in os.listdir(moduleDir) if f.endswith('gents.py')])
+
+    for moduleName in candidates:
+        try:
+            module = __import__(moduleName)
+        except ImportError:
             continue
-        moduleNames = [f for f in os.listdir(
-            moduleDir) if f.endswith('gents.py')]
-        for modulename in moduleNames:
-            try:
-                module = __import__(modulename[:-3])
-            except ImportError:
-                continue
-            if pacman in dir(module):
-                if nographics and modulename == 'keyboardAgents.py':
-                    raise Exception(
-                        'Using the keyboard requires graphics (not text display)')
-                return getattr(module, pacman)
+        if pacman in dir(module):
+            if nographics and moduleName == 'keyboardAgents':
+                raise Exception(
+                    'Using the keyboard requires graphics (not text display)')
+            return getattr(module, pacman)
     raise Exception('The agent ' + pacman +
                     ' is not specified in any *Agents.py.')
 
@@ -672,38 +923,155 @@ def replayGame(layout, actions, display):
     display.finish()
 
 
-def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30):
+def replayRecordedGame(filename, display, startMove=0, waitTime=5.0):
+    """
+    Replays a gameRecord file from startMove.  A game that is still being
+    recorded is followed as it is written, until it ends or no new move has
+    arrived for waitTime seconds.
+    """
+    import time
+    import gameRecord
+    import pacmanAgents
+    import ghostAgents
+    reader = gameRecord.GameRecordReader(filename)
+    try:
+        rules = ClassicGameRules()
+        agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1)
+                                                 for i in range(reader.numAgents - 1)]
+        game = rules.newGame(reader.layout, agents[0], agents[1:], display)
+        state = game.state = reader.stateAt(startMove)
+        display.initialize(state.data)
+        rules.process(state, game)
+
+        moveIndex = startMove
+        lastMoveTime = time.time()
+        while not game.gameOver:
+            moves = reader.getMoves(moveIndex)
+            if len(moves) == 0:
+                if time.time() - lastMoveTime > waitTime:
+                    break
+                time.sleep(0.05)
+                continue
+            for action in moves:
+                state = game.state = state.generateSuccessor(*action)
+                display.update(state.data)
+                rules.process(state, game)
+            moveIndex += len(moves)
+            lastMoveTime = time.time()
+    finally:
+        reader.close()
+
+    display.finish()
+
+
+def gameSeed(seed, gameIndex):
+    """
+    The random seed for the game at gameIndex, derived from the master seed.
+    """
+    return '%s-%d' % (seed, gameIndex)
+
+
+def recordFileName(gameIndex):
+    import time
+    return ('recorded-game-%d' % (gameIndex + 1)) + \
+        '-'.join([str(t) for t in time.localtime()[1:6]])
+
+
+def recordGame(layout, game, gameIndex):
+    """
+    Writes a finished game to a gameRecord file.
+    """
+    import gameRecord
+    gameRecord.writeGame(recordFileName(gameIndex), layout, game.moveHistory,
+                         len(game.state.data.agentStates))
+
+
+# Game components shared with forked worker processes by runGamesInParallel
+_PARALLEL_GAME = {}
+
+
+def _playGameInWorker(gameIndex):
+    import textDisplay
+    options = _PARALLEL_GAME
+    random.seed(gameSeed(options['seed'], gameIndex))
+    rules = ClassicGameRules(options['timeout'])
+    game = rules.newGame(options['layout'], options['pacman'], options['ghosts'],
+                         textDisplay.NullGraphics(), True, options['catchExceptions'])
+    game.run()
+    # Agents and displays need not be picklable; the caller only wants results
+    game.agents = None
+    game.display = None
+    return gameIndex, game
+
+
+def runGamesInParallel(layout, pacman, ghosts, numGames, catchExceptions, timeout, workers, seed):
+    """
+    Plays numGames games across a pool of worker processes, without graphics.
+    Each game is seeded with gameSeed(seed, i), so its outcome is the same as
+    in a sequential run with the same seed.  Games are reported as they finish
+    and returned in order.
+    """
+    import multiprocessing
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise Exception('Parallel games need the fork process start method')
+    _PARALLEL_GAME.update({'layout': layout, 'pacman': pacman, 'ghosts': ghosts,
+                           'catchExceptions': catchExceptions, 'timeout': timeout, 'seed': seed})
+    rules = ClassicGameRules(timeout)
+    rules.quiet = False
+    games = [None] * numGames
+    pool = multiprocessing.get_context('fork').Pool(workers)
+    try:
+        for gameIndex, game in pool.imap_unordered(_playGameInWorker, range(numGames)):
+            rules.process(game.state, game)
+            games[gameIndex] = game
+    finally:
+        pool.close()
+        pool.join()
+        _PARALLEL_GAME.clear()
+    return games
+
+
+def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30, workers=1, seed=None, timings=None):
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
     games = []
 
-    for i in range(numGames):
-        beQuiet = i < numTraining
-        if beQuiet:
-                # Suppress output and graphics
-            import textDisplay
-            gameDisplay = textDisplay.NullGraphics()
-            rules.quiet = True
-        else:
-            gameDisplay = display
-            rules.quiet = False
-        game = rules.newGame(layout, pacman, ghosts,
-                             gameDisplay, beQuiet, catchExceptions)
-        game.run()
-        if not beQuiet:
-            games.append(game)
-
+    if workers > 1:
+        if numTraining > 0:
+            raise Exception('Training games cannot be played in parallel workers')
+        games = runGamesInParallel(layout, pacman, ghosts, numGames,
+                                   catchExceptions, timeout, workers, seed)
         if record:
-            import time
-            import pickle
-            fname = ('recorded-game-%d' % (i + 1)) + \
-                '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            pickle.dump(components, f)
-            f.close()
+            for i, game in enumerate(games):
+                recordGame(layout, game, i)
+    else:
+        for i in range(numGames):
+            if seed != None:
+                random.seed(gameSeed(seed, i))
+            beQuiet = i < numTraining
+            if beQuiet:
+                    # Suppress output and graphics
+                import textDisplay
+                gameDisplay = textDisplay.NullGraphics()
+                rules.quiet = True
+            else:
+                gameDisplay = display
+                rules.quiet = False
+            game = rules.newGame(layout, pacman, ghosts,
+                                 gameDisplay, beQuiet, catchExceptions)
+            if record:
+                # Write moves as they are played, so the game can be watched with --replay
+                import gameRecord
+                game.recorder = gameRecord.GameRecordWriter(recordFileName(i))
+            try:
+                game.run()
+            finally:
+                if game.recorder != None:
+                    game.recorder.close()
+            if not beQuiet:
+                games.append(game)
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
@@ -716,6 +1084,10 @@ def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, c
         print('Record:       ', ', '.join(
             [['Loss', 'Win'][int(w)] for w in wins]))
 
+    if timings != None:
+        from game import exportTimings
+        exportTimings(games, timings)
+
     return games
 
 
@@ -730,6 +1102,9 @@ if __name__ == '__main__':
 
     > python pacman.py --help
     """
+    # Agent modules import pacman: let them use this module rather than load
+    # and run a second copy of it
+    sys.modules['pacman'] = sys.modules['__main__']
     args = readCommand(sys.argv[1:])  # Get game components based on input
     runGames(**args)
 
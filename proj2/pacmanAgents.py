@@ -21,6 +21,7 @@ import util
 
 class LeftTurnAgent(game.Agent):
     "An agent that turns left at every opportunity"
+    mutatesObservations = False
 
     def getAction(self, state):
         legal = state.getLegalPacmanActions()
@@ -40,6 +41,8 @@ class LeftTurnAgent(game.Agent):
 
 
 class GreedyAgent(Agent):
+    mutatesObservations = False
+
     def __init__(self, evalFn="scoreEvaluation"):
         self.evaluationFunction = util.lookup(evalFn, globals())
         assert self.evaluationFunction != None
@@ -0,0 +1,371 @@
+# batchPacman.py
+# --------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A batched Pacman environment for reinforcement learning and agent evaluation.
+
+BatchPacmanEnvironment plays many independent classic Pacman games on one
+layout in lockstep.  Rather than a GameState object graph, every game is a
+handful of integers kept in per-field lists: Pacman's cell, each ghost's
+position (in half-cell units, so scared ghosts can move at half speed), heading
+and scared timer, and the food and capsules as int bitboards.  Legal moves
+come from the layout's compiled game.MoveTable, and the built-in ghost
+policies (RandomGhost and DirectionalGhost from ghostAgents.py) are applied
+directly to these fields.  The rules are the same as pacman.ClassicGameRules.
+
+A step takes one Pacman action per game, moves every ghost, and returns the
+new states, the score changes and which games ended.  Ended games restart on
+their own, so the batch always holds numGames live games:
+
+  env = BatchPacmanEnvironment(layout.getLayout('smallGrid'), 64)
+  trainAgent(agent, env, 100000)
+
+The states handed out are BatchGameStates, which answer the part of the
+pacman.GameState interface used by the learning agents and feature
+extractors (getLegalActions, getPacmanPosition, getFood, ...), so a
+learningAgents.ReinforcementAgent can learn from them directly.
+"""
+
+from game import Directions, Actions, BitGrid
+import random
+
+SCARED_TIME = 40    # Moves ghosts are scared
+TIME_PENALTY = 1    # Number of points lost each round
+
+# Moves in half-cell units: a normal move is two units, a scared one is one
+_HALF_VECTORS = dict([(dir, (2 * dx, 2 * dy))
+                      for dir, (dx, dy) in Actions._directions.items()])
+
+
+class BatchGameState:
+    """
+    An immutable snapshot of one game in a BatchPacmanEnvironment, offering the
+    read-only part of the pacman.GameState interface.  Snapshots compare and
+    hash by value, so they can key tabular Q-values.
+    """
+    __slots__ = ('env', 'pacman', 'ghosts', 'food', 'capsules', 'score', 'win', 'lose')
+
+    def __init__(self, env, pacman, ghosts, food, capsules, score, win, lose):
+        self.env = env
+        self.pacman = pacman
+        self.ghosts = ghosts
+        self.food = food
+        self.capsules = capsules
+        self.score = score
+        self.win = win
+        self.lose = lose
+
+    def getLegalActions(self, agentIndex=0):
+        if self.win or self.lose:
+            return []
+        if agentIndex == 0:
+            return list(self.env.moveTable.actions[self.pacman])
+        return self.env.ghostLegalActions(*self.ghosts[agentIndex - 1][:3])
+
+    def getLegalPacmanActions(self):
+        return self.getLegalActions(0)
+
+    def getPacmanPosition(self):
+        return self.env.cellPositions[self.pacman]
+
+    def getGhostPositions(self):
+        return [(x2 / 2.0, y2 / 2.0) for x2, y2, heading, timer in self.ghosts]
+
+    def getGhostPosition(self, agentIndex):
+        x2, y2 = self.ghosts[agentIndex - 1][:2]
+        return (x2 / 2.0, y2 / 2.0)
+
+    def getScaredTimes(self):
+        return [timer for x2, y2, heading, timer in self.ghosts]
+
+    def getNumAgents(self):
+        return len(self.ghosts) + 1
+
+    def getScore(self):
+        return float(self.score)
+
+    def getFood(self):
+        return BitGrid(self.env.width, self.env.height, bits=self.food)
+
+    def getNumFood(self):
+        return bin(self.food).count('1')
+
+    def hasFood(self, x, y):
+        return (self.food >> (x * self.env.height + y)) & 1 == 1
+
+    def getWalls(self):
+        return self.env.layout.walls
+
+    def hasWall(self, x, y):
+        return self.env.layout.walls[x][y]
+
+    def getCapsules(self):
+        return [self.env.cellPositions[cell] for cell in _bitIndices(self.capsules)]
+
+    def isWin(self):
+        return self.win
+
+    def isLose(self):
+        return self.lose
+
+    def _key(self):
+        return (self.pacman, self.ghosts, self.food, self.capsules, self.score)
+
+    def __eq__(self, other):
+        return isinstance(other, BatchGameState) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        return 'BatchGameState(pacman=%s, ghosts=%s, food=%d, score=%d)' % (
+            self.getPacmanPosition(), self.getGhostPositions(), self.getNumFood(), self.score)
+
+
+class BatchPacmanEnvironment:
+    """
+    Steps numGames independent classic Pacman games on one layout in lockstep.
+
+    ghostType is 'RandomGhost' or 'DirectionalGhost'; numGhosts caps the ghosts
+    taken from the layout, as the -k option of pacman.py does.  Passing a seed
+    makes the ghosts' choices reproducible.
+    """
+
+    def __init__(self, layout, numGames, ghostType='RandomGhost', numGhosts=None,
+                 seed=None, prob_attack=0.8, prob_scaredFlee=0.8):
+        if ghostType not in ('RandomGhost', 'DirectionalGhost'):
+            raise Exception('Unsupported ghost type for batch games: ' + str(ghostType))
+        self.layout = layout
+        self.numGames = numGames
+        self.directional = ghostType == 'DirectionalGhost'
+        self.prob_attack = prob_attack
+        self.prob_scaredFlee = prob_scaredFlee
+        self.random = random.Random(seed)
+
+        self.width, self.height = layout.width, layout.height
+        self.moveTable = layout.walls.moveTable
+        self.cellPositions = [(x, y) for x in range(self.width) for y in range(self.height)]
+
+        ghostStarts = [pos for isPacman, pos in layout.agentPositions if not isPacman]
+        if numGhosts != None:
+            ghostStarts = ghostStarts[:numGhosts]
+        pacmanStart = [pos for isPacman, pos in layout.agentPositions if isPacman][0]
+        self.pacmanStart = self.cellOf(pacmanStart)
+        self.ghostStarts = tuple([(2 * x, 2 * y, Directions.STOP, 0) for x, y in ghostStarts])
+        self.foodStart = BitGrid.fromGrid(layout.food).bits
+        self.capsuleStart = 0
+        for pos in layout.capsules:
+            self.capsuleStart |= 1 << self.cellOf(pos)
+
+        self.episodesDone = 0
+        self.reset()
+
+    def cellOf(self, pos):
+        x, y = pos
+        return int(x) * self.height + int(y)
+
+    def reset(self):
+        """
+        Restarts every game in the batch and returns their start states.
+        """
+        n = self.numGames
+        self.pacman = [self.pacmanStart] * n
+        self.ghosts = [self.ghostStarts] * n
+        self.food = [self.foodStart] * n
+        self.capsules = [self.capsuleStart] * n
+        self.score = [0] * n
+        return self.getCurrentStates()
+
+    def getCurrentStates(self):
+        return [self.getCurrentState(g) for g in range(self.numGames)]
+
+    def getCurrentState(self, game):
+        return BatchGameState(self, self.pacman[game], self.ghosts[game], self.food[game],
+                              self.capsules[game], self.score[game], False, False)
+
+    def getPossibleActions(self, state):
+        return state.getLegalActions(0)
+
+    def ghostLegalActions(self, x2, y2, heading):
+        if x2 % 2 or y2 % 2:
+            # In between grid points, ghosts must continue straight
+            return [heading]
+        return list(self.moveTable.forward[(x2 // 2) * self.height + y2 // 2][heading])
+
+    def step(self, actions):
+        """
+        Plays one round in every game: Pacman takes actions[g] in game g, then
+        each ghost moves.  Returns (nextStates, rewards, dones), where rewards
+        are score changes.  A game that ended is restarted straight away, so
+        nextStates[g] is its terminal state while getCurrentState(g) is a fresh
+        start.
+        """
+        nextStates = []
+        rewards = []
+        dones = []
+        for g in range(self.numGames):
+            state, reward = self._playRound(g, actions[g])
+            nextStates.append(state)
+            rewards.append(reward)
+            done = state.win or state.lose
+            dones.append(done)
+            if done:
+                self.episodesDone += 1
+                self.pacman[g] = self.pacmanStart
+                self.ghosts[g] = self.ghostStarts
+                self.food[g] = self.foodStart
+                self.capsules[g] = self.capsuleStart
+                self.score[g] = 0
+        return nextStates, rewards, dones
+
+    def _playRound(self, g, action):
+        height = self.height
+        pacman = self.pacman[g]
+        ghosts = list(self.ghosts[g])
+        food = self.food[g]
+        capsules = self.capsules[g]
+        score = self.score[g]
+        win = lose = False
+
+        # Pacman moves
+        if action not in self.moveTable.actions[pacman]:
+            raise Exception("Illegal action " + str(action))
+        dx, dy = Actions._directions[action]
+        pacman += dx * height + dy
+        change = -TIME_PENALTY
+        bit = 1 << pacman
+        if food & bit:
+            food ^= bit
+            change += 10
+            if not food:
+                change += 500
+                win = True
+        if capsules & bit:
+            capsules ^= bit
+            ghosts = [(x2, y2, heading, SCARED_TIME) for x2, y2, heading, timer in ghosts]
+        px2, py2 = 2 * (pacman // height), 2 * (pacman % height)
+        for i in range(len(ghosts)):
+            ghosts[i], change, lose = self._checkDeath(i, ghosts[i], px2, py2, change, win, lose)
+        score += change
+
+        # Each ghost moves in turn, until the game ends
+        for i in range(len(ghosts)):
+            if win or lose:
+                break
+            x2, y2, heading, timer = ghosts[i]
+            legal = self.ghostLegalActions(x2, y2, heading)
+            if legal:
+                heading = self._chooseGhostAction(legal, x2, y2, timer, px2, py2)
+                vx, vy = _HALF_VECTORS[heading]
+                if timer > 0:
+                    vx, vy = vx // 2, vy // 2
+                x2, y2 = x2 + vx, y2 + vy
+            if timer == 1:
+                x2, y2 = 2 * ((x2 + 1) // 2), 2 * ((y2 + 1) // 2)
+            timer = max(0, timer - 1)
+            ghost, change, lose = self._checkDeath(i, (x2, y2, heading, timer), px2, py2, 0, win, lose)
+            ghosts[i] = ghost
+            score += change
+
+        ghosts = tuple(ghosts)
+        self.pacman[g] = pacman
+        self.ghosts[g] = ghosts
+        self.food[g] = food
+        self.capsules[g] = capsules
+        reward = score - self.score[g]
+        self.score[g] = score
+        return BatchGameState(self, pacman, ghosts, food, capsules, score, win, lose), reward
+
+    def _checkDeath(self, i, ghost, px2, py2, change, win, lose):
+        x2, y2, heading, timer = ghost
+        if abs(x2 - px2) + abs(y2 - py2) <= 1:
+            if timer > 0:
+                change += 200
+                ghost = self.ghostStarts[i]
+            elif not win:
+                change -= 500
+                lose = True
+        return ghost, change, lose
+
+    def _chooseGhostAction(self, legal, x2, y2, timer, px2, py2):
+        if not self.directional:
+            return legal[int(self.random.random() * len(legal))]
+
+        # DirectionalGhost: rush Pacman, or flee when scared
+        distances = []
+        for action in legal:
+            vx, vy = _HALF_VECTORS[action]
+            if timer > 0:
+                vx, vy = vx // 2, vy // 2
+            distances.append(abs(x2 + vx - px2) + abs(y2 + vy - py2))
+        if timer > 0:
+            bestDistance = max(distances)
+            bestProb = self.prob_scaredFlee
+        else:
+            bestDistance = min(distances)
+            bestProb = self.prob_attack
+        bestActions = [a for a, d in zip(legal, distances) if d == bestDistance]
+        if self.random.random() < bestProb:
+            return bestActions[int(self.random.random() * len(bestActions))]
+        return legal[int(self.random.random() * len(legal))]
+
+
+def _bitIndices(bits):
+    indices = []
+    while bits:
+        low = bits & -bits
+        indices.append(low.bit_length() - 1)
+        bits ^= low
+    return indices
+
+
+def trainAgent(agent, env, numSteps):
+    """
+    Runs agent, a learningAgents.ReinforcementAgent, on every game of env for
+    numSteps batch steps, feeding each transition to agent.observeTransition
+    (and so to agent.update).  Returns the number of games that ended.
+
+    Each game that ends is an episode, as it would be under pacman.runGames:
+    the agent's stopEpisode is called with that game's rewards, and then its
+    startEpisode, so episodesSoFar and the switch from training to testing
+    advance as the batched games finish.
+
+    >>> import layout, qlearningAgents
+    >>> env = BatchPacmanEnvironment(layout.getLayout('smallGrid'), 16, seed=0)
+    >>> agent = qlearningAgents.PacmanQAgent(numTraining=10)
+    >>> finished = trainAgent(agent, env, 200)
+    >>> agent.episodesSoFar == finished, finished > 10
+    (True, True)
+    >>> agent.isInTesting(), agent.epsilon, agent.alpha
+    (True, 0.0, 0.0)
+    """
+    agent.startEpisode()
+    states = env.getCurrentStates()
+    done = env.episodesDone
+    episodeRewards = [0.0] * env.numGames
+    for step in range(numSteps):
+        actions = [agent.getAction(state) for state in states]
+        nextStates, rewards, dones = env.step(actions)
+        for g in range(env.numGames):
+            agent.observeTransition(states[g], actions[g], nextStates[g], rewards[g])
+            episodeRewards[g] += rewards[g]
+            if dones[g]:
+                # The agent sums the rewards of all the games; stop the
+                # episode with this game's own
+                agent.episodeRewards = episodeRewards[g]
+                agent.stopEpisode()
+                agent.startEpisode()
+                episodeRewards[g] = 0.0
+        states = env.getCurrentStates()
+    return env.episodesDone - done
@@ -0,0 +1,210 @@
+# gameRecord.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A compact, append-only binary format for recorded Pacman games.
+
+A record file is a header followed by frames:
+
+  header   MAGIC, then (snapshot interval, number of agents, layout text length)
+           and the layout text itself
+  frame j  a snapshot of the state after j * interval moves (as packed by
+           GameState.toBytes), followed by up to interval two-byte move
+           records (agentIndex, action code)
+
+Every snapshot of a given game has the same size, so the file offset of any
+move or snapshot is simple arithmetic.  stateAt(i) loads the snapshot at or
+before move i and replays fewer than interval moves, whatever the length of
+the game.  A GameRecordWriter flushes every move as it is played, and a
+GameRecordReader sizes the record from the file length on each call, so a
+game can be followed while it is still being written.  Reading a record
+never unpickles anything.
+"""
+
+from game import Directions
+import struct
+
+MAGIC = b'PACREC2\n'
+SNAPSHOT_INTERVAL = 64
+
+_HEADER = struct.Struct('<HBI')
+_MOVE = struct.Struct('<BB')
+
+ACTIONS = [Directions.NORTH, Directions.SOUTH,
+           Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict([(action, code) for code, action in enumerate(ACTIONS)])
+
+
+class GameRecordWriter:
+    """
+    Appends a game to a binary record file as it is played:
+
+      writer = GameRecordWriter(filename, interval)
+      writer.start(initialState)
+      writer.recordMove(agentIndex, action, stateAfterTheMove)  # every move
+      writer.close()
+    """
+
+    def __init__(self, filename, interval=SNAPSHOT_INTERVAL):
+        self.filename = filename
+        self.interval = interval
+        self.file = None
+        self.numMoves = 0
+
+    def start(self, state):
+        layout = state.data.layout
+        layoutText = '\n'.join(layout.layoutText).encode('utf-8')
+        self.file = open(self.filename, 'wb')
+        self.file.write(MAGIC)
+        self.file.write(_HEADER.pack(self.interval, len(state.data.agentStates), len(layoutText)))
+        self.file.write(layoutText)
+        self.file.write(state.toBytes())
+        self.file.flush()
+
+    def recordMove(self, agentIndex, action, state):
+        self.file.write(_MOVE.pack(agentIndex, ACTION_CODES[action]))
+        self.numMoves += 1
+        if self.numMoves % self.interval == 0:
+            self.file.write(state.toBytes())
+        self.file.flush()
+
+    def close(self):
+        if self.file != None:
+            self.file.close()
+            self.file = None
+
+
+def writeGame(filename, layout, moveHistory, numAgents, interval=SNAPSHOT_INTERVAL):
+    """
+    Records a finished game from its layout and Game.moveHistory, replaying
+    it to take the snapshots.
+    """
+    from pacman import GameState
+    state = GameState()
+    state.initialize(layout, numAgents - 1)
+    writer = GameRecordWriter(filename, interval)
+    writer.start(state)
+    try:
+        for agentIndex, action in moveHistory:
+            state = state.generateSuccessor(agentIndex, action)
+            writer.recordMove(agentIndex, action, state)
+    finally:
+        writer.close()
+
+
+def isGameRecord(filename):
+    f = open(filename, 'rb')
+    try:
+        return f.read(len(MAGIC)) == MAGIC
+    finally:
+        f.close()
+
+
+def _readHeader(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise Exception('Not a Pacman game record')
+    interval, numAgents, textLength = _HEADER.unpack(f.read(_HEADER.size))
+    layoutText = f.read(textLength).decode('utf-8').split('\n')
+    return interval, numAgents, layoutText
+
+
+class GameRecordReader:
+    """
+    Random access to a game record file, which may still be being written.
+    """
+
+    def __init__(self, filename):
+        import layout
+        from pacman import GameState
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.interval, self.numAgents, layoutText = _readHeader(self.file)
+        self.headerSize = self.file.tell()
+        self.layout = layout.Layout(layoutText)
+        self.snapshotSize = GameState.packedSize(
+            self.layout.width, self.layout.height, self.numAgents)
+        self.frameSize = self.snapshotSize + self.interval * _MOVE.size
+
+    def close(self):
+        self.file.close()
+
+    def getNumMoves(self):
+        """
+        The number of moves written so far.
+        """
+        self.file.seek(0, 2)
+        size = self.file.tell() - self.headerSize
+        frames, rest = divmod(size, self.frameSize)
+        return frames * self.interval + max(0, rest - self.snapshotSize) // _MOVE.size
+
+    def _moveOffset(self, moveIndex):
+        frame, slot = divmod(moveIndex, self.interval)
+        return self.headerSize + frame * self.frameSize + self.snapshotSize + slot * _MOVE.size
+
+    def getMoves(self, start=0, stop=None):
+        """
+        Returns the (agentIndex, action) moves from start up to stop.
+        """
+        numMoves = self.getNumMoves()
+        if stop == None or stop > numMoves:
+            stop = numMoves
+        moves = []
+        moveIndex = start
+        while moveIndex < stop:
+            count = min(stop - moveIndex, self.interval - moveIndex % self.interval)
+            self.file.seek(self._moveOffset(moveIndex))
+            raw = self.file.read(count * _MOVE.size)
+            for agentIndex, code in _MOVE.iter_unpack(raw):
+                moves.append((agentIndex, ACTIONS[code]))
+            moveIndex += count
+        return moves
+
+    def stateAt(self, moveIndex):
+        """
+        Returns the pacman.GameState after the first moveIndex moves, starting
+        from the nearest snapshot.
+        """
+        if moveIndex < 0 or moveIndex > self.getNumMoves():
+            raise IndexError('No move %d in %s' % (moveIndex, self.filename))
+        from pacman import GameState
+        frame = moveIndex // self.interval
+        self.file.seek(self.headerSize + frame * self.frameSize)
+        state = GameState.fromBytes(self.layout, self.file.read(self.snapshotSize))
+        for agentIndex, action in self.getMoves(frame * self.interval, moveIndex):
+            state = state.generateSuccessor(agentIndex, action)
+        return state
+
+
+def readGames(filenames):
+    """
+    Yields (layoutText, moves) for each record file, reading only the layout
+    and the move records.  Meant for scanning many recorded games quickly.
+    """
+    from pacman import GameState
+    for filename in filenames:
+        f = open(filename, 'rb')
+        try:
+            interval, numAgents, layoutText = _readHeader(f)
+            snapshotSize = GameState.packedSize(len(layoutText[0]), len(layoutText), numAgents)
+            body = f.read()
+        finally:
+            f.close()
+        moves = []
+        frameSize = snapshotSize + interval * _MOVE.size
+        for start in range(0, len(body), frameSize):
+            chunk = body[start + snapshotSize:start + frameSize]
+            chunk = chunk[:len(chunk) - len(chunk) % _MOVE.size]
+            for agentIndex, code in _MOVE.iter_unpack(chunk):
+                moves.append((agentIndex, ACTIONS[code]))
+        yield layoutText, moves
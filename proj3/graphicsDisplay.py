@@ -13,7 +13,9 @@
 
 
 from graphicsUtils import *
+import collections
 import math
+import threading
 import time
 from game import Directions
 
@@ -663,6 +665,138 @@ class PacmanGraphics:
         refresh()
 
 
+class ThreadedPacmanGraphics(PacmanGraphics):
+    """
+    A PacmanGraphics that draws on a thread of its own, so the game never
+    waits for the screen.
+
+    update() only leaves the newest state packet where the render thread can
+    find it.  The render thread draws at most maxFrameRate frames a second,
+    always from the latest packet, and drops any packets that arrived in
+    between.  The game edits packets in place (GameState.applyMove and
+    undoMove), so update() hands the render thread a deepCopy of each one
+    rather than the live packet.  maxFrameRate None or 0 draws every packet
+    as soon as it can.  Other display calls (initialize, updateDistributions,
+    drawExpandedCells) are queued and all run, in order.
+
+    Every Tk call happens on the render thread, which owns the window, so
+    this display is meant for watching computer agents: a KeyboardAgent
+    reads keys on the game's thread.
+    """
+
+    def __init__(self, zoom=1.0, frameTime=0.0, capture=False, maxFrameRate=30):
+        PacmanGraphics.__init__(self, zoom, frameTime, capture)
+        if maxFrameRate == None or maxFrameRate == 0:
+            self.frameInterval = 0.0
+        elif maxFrameRate > 0:
+            self.frameInterval = 1.0 / maxFrameRate
+        else:
+            raise Exception('maxFrameRate must be positive, or 0 or None for no limit, not %s' %
+                            maxFrameRate)
+        # Both deques are only appended to by the game thread and popped by
+        # the render thread; deque appends and pops are atomic.
+        self.latestFrame = collections.deque(maxlen=1)
+        self.commands = collections.deque()
+        self.renderThread = None
+        self.running = False
+        self.framesSubmitted = 0
+        self.framesDrawn = 0
+
+    def initialize(self, state, isBlue=False):
+        self.commands.append(
+            (ThreadedPacmanGraphics.startFrames, (state.deepCopy(), isBlue)))
+        if self.renderThread == None:
+            self.running = True
+            self.renderThread = threading.Thread(
+                target=self.render, name='PacmanGraphics')
+            self.renderThread.daemon = True
+            self.renderThread.start()
+
+    def update(self, newState):
+        self.framesSubmitted += 1
+        self.latestFrame.append(newState.deepCopy())
+
+    def updateDistributions(self, distributions):
+        distributions = [x.copy() for x in distributions]
+        self.commands.append(
+            (PacmanGraphics.updateDistributions, (distributions,)))
+
+    def drawExpandedCells(self, cells):
+        self.commands.append(
+            (PacmanGraphics.drawExpandedCells, (list(cells),)))
+
+    def finish(self):
+        """
+        Waits for the last frame to be drawn, then closes the window.
+        """
+        self.running = False
+        if self.renderThread != None:
+            self.renderThread.join()
+            self.renderThread = None
+
+    def startFrames(self, state, isBlue):
+        PacmanGraphics.initialize(self, state, isBlue)
+        self.drawnFood = state.food
+        self.drawnCapsules = state.capsules
+
+    def render(self):
+        nextFrame = time.time()
+        while True:
+            # Read before popping: finish() is only called after the last
+            # update, so once running is False the final frame is waiting.
+            finished = not self.running
+            while len(self.commands) > 0:
+                command, args = self.commands.popleft()
+                command(self, *args)
+            try:
+                state = self.latestFrame.pop()
+            except IndexError:
+                state = None
+            if state != None:
+                self.drawFrame(state)
+                self.framesDrawn += 1
+            elif finished:
+                break
+            nextFrame = max(nextFrame + self.frameInterval, time.time())
+            sleep(max(0, nextFrame - time.time()))
+        PacmanGraphics.finish(self)
+
+    def drawFrame(self, newState):
+        """
+        Brings the window up to date with newState, however many moves it is
+        ahead of the last frame drawn.  Agents jump to their new positions
+        rather than being animated.
+        """
+        for agentIndex, agentState in enumerate(newState.agentStates):
+            prevState, prevImage = self.agentImages[agentIndex]
+            if prevState == agentState and prevState.isPacman == agentState.isPacman:
+                continue
+            if prevState.isPacman != agentState.isPacman:
+                self.swapImages(agentIndex, agentState)
+                prevState, prevImage = self.agentImages[agentIndex]
+            if agentState.isPacman:
+                self.movePacman(self.getPosition(agentState),
+                                self.getDirection(agentState), prevImage)
+            else:
+                self.moveGhost(agentState, agentIndex, prevState, prevImage)
+            self.agentImages[agentIndex] = (agentState, prevImage)
+
+        if newState.food != self.drawnFood:
+            for x, y in self.drawnFood.asList():
+                if not newState.food[x][y]:
+                    self.removeFood((x, y), self.food)
+            self.drawnFood = newState.food
+        if newState.capsules != self.drawnCapsules:
+            for capsule in self.drawnCapsules:
+                if capsule not in newState.capsules:
+                    self.removeCapsule(capsule, self.capsules)
+            self.drawnCapsules = newState.capsules
+        self.infoPane.updateScore(newState.score)
+        if 'ghostDistances' in dir(newState):
+            self.infoPane.updateGhostDistances(newState.ghostDistances)
+        refresh()
+
+
 class FirstPersonPacmanGraphics(PacmanGraphics):
     def __init__(self, zoom=1.0, showGhosts=True, capture=False, frameTime=0):
         PacmanGraphics.__init__(self, zoom, frameTime=frameTime)
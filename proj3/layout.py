@@ -14,57 +14,71 @@
 
 from util import manhattanDistance
 from game import Grid
+from game import Directions
+from game import BitGrid
+from game import MoveTable
 import os
 import random
-from functools import reduce
+import sys
+from array import array
+import struct
+import hashlib
 
 VISIBILITY_MATRIX_CACHE = {}
+MOVE_TABLE_CACHE = {}
 
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are never changed once built, so copies share them: deepCopy
+    returns the layout itself.
     """
 
-    def __init__(self, layoutText):
+    def __init__(self, layoutText, compiled=None):
         self.width = len(layoutText[0])
         self.height = len(layoutText)
-        self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
-        self.capsules = []
-        self.agentPositions = []
-        self.numGhosts = 0
-        self.processLayoutText(layoutText)
+        if compiled == None:
+            self.walls = Grid(self.width, self.height, False)
+            self.food = Grid(self.width, self.height, False)
+            self.capsules = []
+            self.agentPositions = []
+            self.numGhosts = 0
+            self.processLayoutText(layoutText)
+        else:
+            self.loadCompiled(compiled)
         self.layoutText = layoutText
+        self.initializeMoveTable()
         self.totalFood = len(self.food.asList())
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
         return self.numGhosts
 
+    def getMazeDistances(self):
+        """
+        The maze distances between all pairs of cells (see MazeDistances),
+        computed the first time they are asked for.
+        """
+        return getMazeDistances(self.walls)
+
+    def initializeMoveTable(self):
+        """
+        Compiles the legal moves on this layout's walls once, shared by every
+        layout with the same text (see game.MoveTable).
+        """
+        key = tuple(self.layoutText)
+        if key not in MOVE_TABLE_CACHE:
+            MOVE_TABLE_CACHE[key] = MoveTable(self.walls)
+        self.walls.moveTable = MOVE_TABLE_CACHE[key]
+
     def initializeVisibilityMatrix(self):
-        global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
-            from game import Directions
-            vecs = [(-0.5, 0), (0.5, 0), (0, -0.5), (0, 0.5)]
-            dirs = [Directions.NORTH, Directions.SOUTH,
-                    Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH: set(), Directions.SOUTH: set(
-            ), Directions.EAST: set(), Directions.WEST: set(), Directions.STOP: set()})
-            for x in range(self.width):
-                for y in range(self.height):
-                    if self.walls[x][y] == False:
-                        for vec, direction in zip(vecs, dirs):
-                            dx, dy = vec
-                            nextx, nexty = x + dx, y + dy
-                            while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)]:
-                                vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
-            self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
-        else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(
-                str.__add__, self.layoutText)]
+        """
+        Finds what can be seen from each cell, once per maze (see
+        VisibilityMatrix).
+        """
+        self.visibility = getVisibilityMatrix(self.walls)
 
     def isWall(self, pos):
         x, col = pos
@@ -90,14 +104,15 @@ class Layout:
         return pos
 
     def isVisibleFrom(self, ghostPos, pacPos, pacDirection):
-        row, col = [int(x) for x in pacPos]
-        return ghostPos in self.visibility[row][col][pacDirection]
+        if not hasattr(self, 'visibility'):
+            self.initializeVisibilityMatrix()
+        return self.visibility.isVisibleFrom(ghostPos, pacPos, pacDirection)
 
     def __str__(self):
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        return self
 
     def processLayoutText(self, layoutText):
         """
@@ -136,29 +151,481 @@ class Layout:
             self.agentPositions.append((int(layoutChar), (x, y)))
             self.numGhosts += 1
 
+    def compile(self):
+        """
+        Returns the parsed layout as bytes that loadCompiled reads back.
+        """
+        cellBytes = (self.width * self.height + 7) // 8
+        parts = [COMPILED_MAGIC, struct.pack('<HHHHH', self.width, self.height, self.numGhosts,
+                                             len(self.capsules), len(self.agentPositions)),
+                 BitGrid.fromGrid(self.walls).bits.to_bytes(cellBytes, 'little'),
+                 BitGrid.fromGrid(self.food).bits.to_bytes(cellBytes, 'little')]
+        for x, y in self.capsules:
+            parts.append(struct.pack('<HH', x, y))
+        for isPacman, (x, y) in self.agentPositions:
+            parts.append(struct.pack('<BHH', isPacman, x, y))
+        return b''.join(parts)
+
+    def loadCompiled(self, data):
+        if not data.startswith(COMPILED_MAGIC):
+            raise Exception('Not a compiled layout')
+        offset = len(COMPILED_MAGIC)
+        width, height, self.numGhosts, numCapsules, numAgents = struct.unpack_from(
+            '<HHHHH', data, offset)
+        if (width, height) != (self.width, self.height):
+            raise Exception('Compiled layout does not match its text')
+        offset += struct.calcsize('<HHHHH')
+        cellBytes = (width * height + 7) // 8
+        grids = []
+        for i in range(2):
+            bits = int.from_bytes(data[offset:offset + cellBytes], 'little')
+            grids.append(BitGrid(width, height, bits=bits).toGrid())
+            offset += cellBytes
+        self.walls, self.food = grids
+        self.capsules = [struct.unpack_from('<HH', data, offset + 4 * i)
+                         for i in range(numCapsules)]
+        offset += 4 * numCapsules
+        self.agentPositions = []
+        for i in range(numAgents):
+            isPacman, x, y = struct.unpack_from('<BHH', data, offset + 5 * i)
+            self.agentPositions.append((bool(isPacman), (x, y)))
+
+
+COMPILED_MAGIC = b'PACLAY1\n'
+COMPILED_DIRECTORY = '__layoutcache__'
+
+
+class LayoutRegistry:
+    """
+    Finds layout files by name and parses each distinct layout only once.
+
+    Each layouts/ directory searched is listed once and its layouts indexed
+    by name, until its modification time changes.
+    Parsed layouts are memoized by a hash of their text, and a compiled copy
+    is kept beside the .lay file (in __layoutcache__/<hash>.layc) so later
+    runs skip parsing too.  Layouts are immutable, so the same object is
+    handed to every caller.
+    """
+
+    def __init__(self):
+        self.directoryIndexes = {}
+        self.layouts = {}
+
+    def indexDirectory(self, directory):
+        """
+        Returns {name: path} for the layout files in directory; both 'name' and
+        'name.lay' are indexed.  The listing is kept until the directory's
+        modification time changes, so layouts added later are still found.
+        """
+        try:
+            modified = os.stat(directory).st_mtime_ns
+        except OSError:
+            modified = None
+        cached = self.directoryIndexes.get(directory)
+        if cached == None or cached[0] != modified:
+            index = {}
+            if modified != None:
+                for filename in os.listdir(directory):
+                    if filename.endswith('.lay'):
+                        path = os.path.join(directory, filename)
+                        index[filename] = path
+                        index[filename[:-len('.lay')]] = path
+            cached = self.directoryIndexes[directory] = (modified, index)
+        return cached[1]
+
+    def findLayout(self, name, back=2):
+        """
+        Looks for the layout in layouts/ and then in the directory itself,
+        starting from the current directory and going up back + 1 levels, as
+        getLayout always has.  Plain names are looked up in the index of
+        layouts/; names with a directory in them (such as 'tests/maze') are
+        checked on disk.
+        """
+        fileName = name if name.endswith('.lay') else name + '.lay'
+        hasDirectory = os.path.dirname(fileName) != ''
+        directory = os.path.abspath('.')
+        for level in range(back + 2):
+            layoutsDirectory = os.path.join(directory, 'layouts')
+            if hasDirectory:
+                path = os.path.join(layoutsDirectory, fileName)
+                if not os.path.exists(path):
+                    path = None
+            else:
+                path = self.indexDirectory(layoutsDirectory).get(fileName)
+            if path == None and os.path.exists(os.path.join(directory, fileName)):
+                path = os.path.join(directory, fileName)
+            if path != None:
+                return path
+            directory = os.path.dirname(directory)
+        return None
+
+    def getLayout(self, name, back=2):
+        path = self.findLayout(name, back)
+        if path == None:
+            return None
+        return self.loadLayout(path)
+
+    def loadLayout(self, path):
+        f = open(path)
+        try:
+            layoutText = [line.strip() for line in f]
+        finally:
+            f.close()
+        key = hashlib.sha1('\n'.join(layoutText).encode('utf-8')).hexdigest()
+        if key not in self.layouts:
+            self.layouts[key] = self.compiledLayout(path, key, layoutText)
+        return self.layouts[key]
+
+    def compiledLayout(self, path, key, layoutText):
+        """
+        Builds the layout from its compiled copy, compiling it first if there
+        is none.  A cache directory that cannot be written is not an error.
+        """
+        compiledPath = os.path.join(os.path.dirname(path), COMPILED_DIRECTORY, key + '.layc')
+        if os.path.exists(compiledPath):
+            try:
+                f = open(compiledPath, 'rb')
+                try:
+                    return Layout(layoutText, f.read())
+                finally:
+                    f.close()
+            except Exception:
+                pass
+        layout = Layout(layoutText)
+        try:
+            os.makedirs(os.path.dirname(compiledPath), exist_ok=True)
+            # Write to a temporary name, so readers never see a partial file
+            temporaryPath = '%s.%d' % (compiledPath, os.getpid())
+            f = open(temporaryPath, 'wb')
+            try:
+                f.write(layout.compile())
+            finally:
+                f.close()
+            os.replace(temporaryPath, compiledPath)
+        except OSError:
+            pass
+        return layout
+
+
+LAYOUT_REGISTRY = LayoutRegistry()
+
+
+MAZE_DISTANCE_CACHE = {}
+MAZE_CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    'layouts', '__layoutcache__')
+MAZE_DISTANCE_MAGIC = b'PACDIST1'
+VISIBILITY_MAGIC = b'PACVIS1\n'
+
+
+class MazeDistances:
+    """
+    The maze distance between every pair of cells on a grid of walls.
+
+    Cells are numbered x * height + y, and the distance from cell a to cell b
+    is distances[a * cells + b], in one flat array of 16-bit ints.  Walls and
+    cells that cannot be reached hold UNREACHABLE.  Use getMazeDistances(walls)
+    (or Layout.getMazeDistances) rather than building these directly: it runs
+    the breadth-first searches once per maze, and keeps the result in memory
+    and on disk.
+    """
+    UNREACHABLE = 32767
+
+    def __init__(self, walls, distances=None):
+        self.width = walls.width
+        self.height = walls.height
+        self.cells = walls.width * walls.height
+        if distances == None:
+            distances = self.computeDistances(walls)
+        self.distances = distances
+        self.rows = memoryview(distances)
+
+    def computeDistances(self, walls):
+        """
+        Runs a breadth-first search from every open cell.
+        """
+        width, height, cells = self.width, self.height, self.cells
+        neighbors = [()] * cells
+        for x in range(width):
+            for y in range(height):
+                if not walls[x][y]:
+                    neighbors[x * height + y] = tuple(
+                        [nx * height + ny for nx, ny in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y))
+                         if 0 <= nx < width and 0 <= ny < height and not walls[nx][ny]])
+        unreachable = self.UNREACHABLE
+        distances = array('h', [unreachable]) * (cells * cells)
+        for source in range(cells):
+            if walls[source // height][source % height]:
+                continue
+            row = source * cells
+            distances[row + source] = 0
+            frontier = [source]
+            distance = 0
+            while frontier:
+                distance += 1
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbor in neighbors[cell]:
+                        if distances[row + neighbor] == unreachable:
+                            distances[row + neighbor] = distance
+                            nextFrontier.append(neighbor)
+                frontier = nextFrontier
+        return distances
+
+    def getDistance(self, pos1, pos2):
+        """
+        The maze distance between two grid positions, or UNREACHABLE.
+        """
+        x1, y1 = pos1
+        x2, y2 = pos2
+        return self.distances[(int(x1) * self.height + int(y1)) * self.cells +
+                              int(x2) * self.height + int(y2)]
+
+    def contains(self, pos):
+        """
+        Whether pos is an open cell of the maze.
+        """
+        x, y = pos
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        cell = int(x) * self.height + int(y)
+        return self.distances[cell * self.cells + cell] == 0
+
+    def getRow(self, pos):
+        """
+        The distances from pos to every cell, indexed by cell number.  This is a
+        view into the table, not a copy.
+        """
+        x, y = pos
+        start = (int(x) * self.height + int(y)) * self.cells
+        return self.rows[start:start + self.cells]
+
+    def getDistances(self, pos, positions):
+        """
+        Returns the list of distances from pos to each of positions.
+        """
+        row = self.getRow(pos)
+        height = self.height
+        return [row[x * height + y] for x, y in positions]
+
+    def getClosestDistance(self, pos, positions):
+        """
+        The distance from pos to the nearest of positions, or None if none of
+        them can be reached.
+        """
+        distances = self.getDistances(pos, positions)
+        if len(distances) == 0 or min(distances) == self.UNREACHABLE:
+            return None
+        return min(distances)
+
+
+class VisibilityMatrix:
+    """
+    What Pacman can see from each cell when facing each direction.
+
+    Pacman sees in a straight line until the line meets a wall.  That includes
+    the points half-way between cells, where a moving ghost can be, so seen
+    positions are numbered on a grid of half cells: (x, y) is bit
+    2x * (2 * height) + 2y.  masks[direction][x * height + y] is an int with a
+    bit set for each position visible from cell (x, y), which makes a lookup
+    one bit test.  Use getVisibilityMatrix(walls) (or
+    Layout.initializeVisibilityMatrix) rather than building these directly.
+    """
+    DIRECTIONS = ((Directions.NORTH, (0, 1)), (Directions.SOUTH, (0, -1)),
+                  (Directions.EAST, (1, 0)), (Directions.WEST, (-1, 0)))
+
+    def __init__(self, walls, masks=None):
+        self.width = walls.width
+        self.height = walls.height
+        if masks == None:
+            masks = self.computeMasks(walls)
+        self.masks = masks
+
+    def computeMasks(self, walls):
+        """
+        Builds each cell's mask from that of the next cell along the line of
+        sight, visiting the cells in that direction first.
+        """
+        width, height = self.width, self.height
+        halfHeight = 2 * height
+        masks = {}
+        for direction, (dx, dy) in self.DIRECTIONS:
+            xs = range(width - 1, -1, -1) if dx > 0 else range(width)
+            ys = range(height - 1, -1, -1) if dy > 0 else range(height)
+            directionMasks = masks[direction] = [0] * (width * height)
+            for x in xs:
+                for y in ys:
+                    halfX, halfY = 2 * x + dx, 2 * y + dy
+                    if walls[x][y] or not (0 <= halfX < 2 * width and 0 <= halfY < halfHeight):
+                        continue
+                    mask = 1 << (halfX * halfHeight + halfY)
+                    nextX, nextY = x + dx, y + dy
+                    if 0 <= nextX < width and 0 <= nextY < height and not walls[nextX][nextY]:
+                        mask |= 1 << ((halfX + dx) * halfHeight + halfY + dy)
+                        mask |= directionMasks[nextX * height + nextY]
+                    directionMasks[x * height + y] = mask
+        return masks
+
+    def isVisibleFrom(self, ghostPos, pacPos, pacDirection):
+        if pacDirection not in self.masks:
+            return False
+        x, y = [int(c) for c in pacPos]
+        halfX, halfY = int(round(2 * ghostPos[0])), int(round(2 * ghostPos[1]))
+        if not (0 <= halfX < 2 * self.width and 0 <= halfY < 2 * self.height):
+            return False
+        mask = self.masks[pacDirection][x * self.height + y]
+        return (mask >> (halfX * 2 * self.height + halfY)) & 1 == 1
+
+
+def wallsKey(walls):
+    """
+    A hash of a grid of walls, which names the tables cached for that maze.
+    """
+    cells = ''.join(['%' if walls[x][y] else ' '
+                     for x in range(walls.width) for y in range(walls.height)])
+    return hashlib.sha1(('%d %d %s' % (walls.width, walls.height, cells)).encode('utf-8')).hexdigest()
+
+
+def getMazeDistances(walls):
+    """
+    Returns the MazeDistances for a grid of walls, computing them at most once
+    per maze.  The table is kept on the walls themselves, in memory keyed by a
+    hash of the walls, and in MAZE_CACHE_DIRECTORY for later runs.
+    """
+    mazeDistances = getattr(walls, 'mazeDistances', None)
+    if mazeDistances != None:
+        return mazeDistances
+    key = wallsKey(walls)
+    if key not in MAZE_DISTANCE_CACHE:
+        MAZE_DISTANCE_CACHE[key] = MazeDistances(walls, loadMazeDistances(key, walls))
+        saveMazeDistances(key, MAZE_DISTANCE_CACHE[key])
+    walls.mazeDistances = MAZE_DISTANCE_CACHE[key]
+    return walls.mazeDistances
+
+
+def getVisibilityMatrix(walls):
+    """
+    Returns the VisibilityMatrix for a grid of walls, cached like
+    getMazeDistances.
+    """
+    visibility = getattr(walls, 'visibility', None)
+    if visibility != None:
+        return visibility
+    key = wallsKey(walls)
+    if key not in VISIBILITY_MATRIX_CACHE:
+        VISIBILITY_MATRIX_CACHE[key] = VisibilityMatrix(walls, loadVisibilityMasks(key, walls))
+        saveVisibilityMasks(key, VISIBILITY_MATRIX_CACHE[key])
+    walls.visibility = VISIBILITY_MATRIX_CACHE[key]
+    return walls.visibility
+
+
+_MAZE_CACHE_HEADER = struct.Struct('<8sHH')
+
+
+def readMazeCache(fileName, magic, walls):
+    """
+    Returns what was saved by writeMazeCache for a maze of this size, or None
+    if nothing usable was saved.
+    """
+    path = os.path.join(MAZE_CACHE_DIRECTORY, fileName)
+    if not os.path.exists(path):
+        return None
+    try:
+        f = open(path, 'rb')
+        try:
+            header = _MAZE_CACHE_HEADER.unpack(f.read(_MAZE_CACHE_HEADER.size))
+            data = f.read()
+        finally:
+            f.close()
+    except (OSError, struct.error):
+        return None
+    if header != (magic, walls.width, walls.height):
+        return None
+    return data
+
+
+def writeMazeCache(fileName, magic, width, height, data):
+    """
+    Saves data in MAZE_CACHE_DIRECTORY, unless it is already there.  A cache
+    directory that cannot be written is not an error.
+    """
+    path = os.path.join(MAZE_CACHE_DIRECTORY, fileName)
+    if os.path.exists(path):
+        return
+    try:
+        os.makedirs(MAZE_CACHE_DIRECTORY, exist_ok=True)
+        # Write to a temporary name, so readers never see a partial file
+        temporaryPath = '%s.%d' % (path, os.getpid())
+        f = open(temporaryPath, 'wb')
+        try:
+            f.write(_MAZE_CACHE_HEADER.pack(magic, width, height))
+            f.write(data)
+        finally:
+            f.close()
+        os.replace(temporaryPath, path)
+    except OSError:
+        pass
+
+
+def loadMazeDistances(key, walls):
+    """
+    Returns the distance array saved for key, or None if there is none.
+    """
+    data = readMazeCache('distances-%s.bin' % key, MAZE_DISTANCE_MAGIC, walls)
+    cells = walls.width * walls.height
+    if data == None or len(data) != 2 * cells * cells:
+        return None
+    distances = array('h')
+    distances.frombytes(data)
+    if sys.byteorder != 'little':
+        distances.byteswap()
+    return distances
+
+
+def saveMazeDistances(key, mazeDistances):
+    distances = mazeDistances.distances
+    if sys.byteorder != 'little':
+        distances = array('h', distances)
+        distances.byteswap()
+    writeMazeCache('distances-%s.bin' % key, MAZE_DISTANCE_MAGIC,
+                   mazeDistances.width, mazeDistances.height, distances.tobytes())
+
+
+def _visibilityMaskBytes(width, height):
+    return (4 * width * height + 7) // 8
+
+
+def loadVisibilityMasks(key, walls):
+    """
+    Returns the visibility masks saved for key, or None if there are none.
+    """
+    data = readMazeCache('visibility-%s.bin' % key, VISIBILITY_MAGIC, walls)
+    cells = walls.width * walls.height
+    size = _visibilityMaskBytes(walls.width, walls.height)
+    if data == None or len(data) != len(VisibilityMatrix.DIRECTIONS) * cells * size:
+        return None
+    masks = {}
+    offset = 0
+    for direction, vector in VisibilityMatrix.DIRECTIONS:
+        masks[direction] = [int.from_bytes(data[start:start + size], 'little')
+                            for start in range(offset, offset + cells * size, size)]
+        offset += cells * size
+    return masks
+
+
+def saveVisibilityMasks(key, visibility):
+    size = _visibilityMaskBytes(visibility.width, visibility.height)
+    data = b''.join([mask.to_bytes(size, 'little')
+                     for direction, vector in VisibilityMatrix.DIRECTIONS
+                     for mask in visibility.masks[direction]])
+    writeMazeCache('visibility-%s.bin' % key, VISIBILITY_MAGIC,
+                   visibility.width, visibility.height, data)
+
 
 def getLayout(name, back=2):
-    if name.endswith('.lay'):
-        layout = tryToLoad('layouts/' + name)
-        if layout == None:
-            layout = tryToLoad(name)
-    else:
-        layout = tryToLoad('layouts/' + name + '.lay')
-        if layout == None:
-            layout = tryToLoad(name + '.lay')
-    if layout == None and back >= 0:
-        curdir = os.path.abspath('.')
-        os.chdir('..')
-        layout = getLayout(name, back - 1)
-        os.chdir(curdir)
-    return layout
+    return LAYOUT_REGISTRY.getLayout(name, back)
 
 
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)):
         return None
-    f = open(fullname)
-    try:
-        return Layout([line.strip() for line in f])
-    finally:
-        f.close()
+    return LAYOUT_REGISTRY.loadLayout(fullname)
@@ -196,7 +196,7 @@ class PrioritizedSweepingValueIterationAgent(AsynchronousValueIterationAgent):
         for state in self.mdp.getStates():
             predecessor[state] = set(predecessor[state])
 
-        queue = util.PriorityQueue()
+        queue = util.IndexedPriorityQueue()
 
         for state in self.mdp.getStates():
             if self.mdp.isTerminal(state):
@@ -76,10 +76,10 @@ class Distancer:
 
   def getDistanceOnGrid(self, pos1, pos2):
     key = (pos1, pos2)
-    if key in self._distances:
-      return self._distances[key]
-    else:
+    distance = self._distances.get(key)
+    if distance == None:
       raise Exception("Positions not in grid: " + str(key))
+    return distance
 
   def isReadyForMazeDistance(self):
     return self._distances != None
@@ -131,7 +131,7 @@ class DistanceCalculator(threading.Thread):
       if distanceThread != None: raise Exception('Multiple distance threads')
       distanceThread = self
 
-      distances = computeDistances(self.layout)
+      distances = self.layout.getMazeDistances()
       print('[Distancer]: Switching to maze distances',file=sys.stdout)
 
       distanceMap[self.layout.walls] = distances
@@ -140,47 +140,41 @@ class DistanceCalculator(threading.Thread):
       distances = distanceMap[self.layout.walls]
 
     distanceMapSemaphore.release()
-    self.distancer._distances = distances
+    self.distancer._distances = MazeDistanceMap(distances)
+
+UNREACHABLE_DISTANCE = 1000000000
+
+class MazeDistanceMap:
+  """
+  A read-only dict of the maze distances between pairs of open cells, keyed
+  by (pos1, pos2), over a layout's MazeDistances table.  The table holds them
+  all in one flat array, so this costs no memory per pair.  Cells with no
+  path between them are UNREACHABLE_DISTANCE apart.
+  """
+  def __init__(self, mazeDistances):
+    self.mazeDistances = mazeDistances
+
+  def __contains__(self, key):
+    pos1, pos2 = key
+    return (isInt(pos1) and isInt(pos2) and
+            self.mazeDistances.contains(pos1) and self.mazeDistances.contains(pos2))
+
+  def __getitem__(self, key):
+    if key not in self:
+      raise KeyError(key)
+    distance = self.mazeDistances.getDistance(*key)
+    if distance == self.mazeDistances.UNREACHABLE:
+      return UNREACHABLE_DISTANCE
+    return distance
+
+  def get(self, key, default=None):
+    if key in self:
+      return self[key]
+    return default
 
 def computeDistances(layout):
-    distances = {}
-    allNodes = layout.walls.asList(False)
-    for source in allNodes:
-        dist = {}
-        closed = {}
-        for node in allNodes:
-            dist[node] = 1000000000
-        import util
-        queue = util.PriorityQueue()
-        queue.push(source, 0)
-        dist[source] = 0
-        while not queue.isEmpty():
-            node = queue.pop()
-            if node in closed:
-                continue
-            closed[node] = True
-            nodeDist = dist[node]
-            adjacent = []
-            x, y = node
-            if not layout.isWall((x,y+1)):
-                adjacent.append((x,y+1))
-            if not layout.isWall((x,y-1)):
-                adjacent.append((x,y-1) )
-            if not layout.isWall((x+1,y)):
-                adjacent.append((x+1,y) )
-            if not layout.isWall((x-1,y)):
-                adjacent.append((x-1,y))
-            for other in adjacent:
-                if not other in dist:
-                    continue
-                oldDist = dist[other]
-                newDist = nodeDist+1
-                if newDist < oldDist:
-                    dist[other] = newDist
-                    queue.push(other, newDist)
-        for target in allNodes:
-            distances[(target, source)] = dist[target]
-    return distances
+    "Returns the maze distances between all pairs of open cells, as a MazeDistanceMap"
+    return MazeDistanceMap(layout.getMazeDistances())
 
 
 def getDistanceOnGrid(distances, pos1, pos2):